@@ -0,0 +1,176 @@
+import os
+import math
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+from client_pool import hash_api_key
+
+logger = logging.getLogger(__name__)
+
+# 프로바이더별 동시 처리 턴 수 / 대기열 길이 / 최대 대기 시간
+ADMISSION_OPENAI_CONCURRENCY = int(os.getenv("ADMISSION_OPENAI_CONCURRENCY", "64"))
+ADMISSION_GEMINI_CONCURRENCY = int(os.getenv("ADMISSION_GEMINI_CONCURRENCY", "64"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "128"))
+ADMISSION_MAX_WAIT_SECONDS = float(os.getenv("ADMISSION_MAX_WAIT_SECONDS", "5"))
+# API 키별 턴 속도 제한 (초당 턴 수, 순간 허용량)
+ADMISSION_KEY_RATE = float(os.getenv("ADMISSION_KEY_RATE", "50"))
+ADMISSION_KEY_BURST = float(os.getenv("ADMISSION_KEY_BURST", "100"))
+ADMISSION_MAX_TRACKED_KEYS = int(os.getenv("ADMISSION_MAX_TRACKED_KEYS", "10000"))
+
+class AdmissionRejected(Exception):
+    """요청을 받지 않고 바로 429로 거절"""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(f"Admission rejected: {reason}")
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+
+class TokenBucket:
+    """초당 rate개씩 채워지고 최대 burst개까지 쌓이는 토큰 버킷"""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def try_acquire(self, amount: float = 1) -> Tuple[bool, float]:
+        """토큰 amount개 사용 (부족하면 채워질 때까지 남은 시간 반환)"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= amount:
+            self.tokens -= amount
+            return True, 0.0
+        return False, (amount - self.tokens) / self.rate
+
+class KeyRateLimiter:
+    """API 키별 토큰 버킷 (키는 해시로만 보관, LRU로 개수 제한)"""
+
+    def __init__(self, rate: float = ADMISSION_KEY_RATE, burst: float = ADMISSION_KEY_BURST,
+                 max_keys: int = ADMISSION_MAX_TRACKED_KEYS):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+
+    def try_acquire(self, api_key: Optional[str]) -> Tuple[bool, float]:
+        key = hash_api_key(api_key or "")
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(self.rate, self.burst)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        return bucket.try_acquire()
+
+class ProviderQueue:
+    """프로바이더별 동시 처리 한도 + 제한된 대기열 (예상 대기 시간이 길면 바로 거절)"""
+
+    def __init__(self, name: str, max_concurrency: int, max_queue: int = ADMISSION_MAX_QUEUE,
+                 max_wait: float = ADMISSION_MAX_WAIT_SECONDS):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.active = 0
+        self.waiting = 0
+        self.avg_service_seconds = 1.0  # 턴 처리 시간 지수 이동 평균
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    def estimated_wait(self) -> float:
+        """지금 들어오면 기다릴 것으로 예상되는 시간"""
+        if self.active < self.max_concurrency:
+            return 0.0
+        return (self.waiting + 1) / self.max_concurrency * self.avg_service_seconds
+
+    async def acquire(self) -> float:
+        """처리 슬롯 확보 (대기열이 가득 찼거나 마감 시간 안에 못 받으면 AdmissionRejected)"""
+        if self.waiting == 0 and not self._semaphore.locked():
+            # 빈 슬롯이 있으면 기다리지 않고 바로 획득
+            await self._semaphore.acquire()
+        else:
+            estimated = self.estimated_wait()
+            if self.waiting >= self.max_queue or estimated > self.max_wait:
+                raise AdmissionRejected(f"{self.name}_busy", estimated)
+
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), timeout=self.max_wait)
+            except asyncio.TimeoutError:
+                raise AdmissionRejected(f"{self.name}_busy", self.estimated_wait())
+            finally:
+                self.waiting -= 1
+        self.active += 1
+        return time.monotonic()
+
+    def release(self, started: float):
+        self.active -= 1
+        self._semaphore.release()
+        self.avg_service_seconds = 0.8 * self.avg_service_seconds + 0.2 * (time.monotonic() - started)
+
+class AdmissionTicket:
+    """입장 허가 (턴이 끝나면 release로 세션 잠금과 프로바이더 슬롯 반납)"""
+
+    def __init__(self, session_lock: asyncio.Lock, slots: List[Tuple[ProviderQueue, float]]):
+        self._session_lock = session_lock
+        self._slots = slots
+        self._released = False
+
+    def release(self):
+        if self._released:
+            return
+        self._released = True
+        for queue, started in self._slots:
+            queue.release(started)
+        self._session_lock.release()
+
+class AdmissionController:
+    """채팅 턴 입장 제어 (세션당 한 턴, 키별 속도 제한, 프로바이더별 대기열)"""
+
+    def __init__(self, queues: Dict[str, ProviderQueue], rate_limiter: KeyRateLimiter):
+        self.queues = queues
+        self.rate_limiter = rate_limiter
+        self.rejections: Dict[str, int] = {}
+
+    def _reject(self, error: AdmissionRejected):
+        self.rejections[error.reason] = self.rejections.get(error.reason, 0) + 1
+        logger.warning(f"Request rejected ({error.reason}), retry after {error.retry_after}s")
+        raise error
+
+    async def acquire(self, session, api_key: Optional[str], providers: Iterable[str]) -> AdmissionTicket:
+        """턴 시작 허가 (거절되면 AdmissionRejected)"""
+        # 같은 세션의 이전 턴이 아직 진행 중이면 바로 거절
+        if session.turn_lock.locked():
+            self._reject(AdmissionRejected("session_busy", 1))
+        await session.turn_lock.acquire()
+
+        slots = []
+        try:
+            allowed, retry_after = self.rate_limiter.try_acquire(api_key)
+            if not allowed:
+                self._reject(AdmissionRejected("rate_limited", retry_after))
+            for name in sorted(set(providers)):
+                queue = self.queues[name]
+                try:
+                    slots.append((queue, await queue.acquire()))
+                except AdmissionRejected as e:
+                    self._reject(e)
+        except BaseException:
+            for queue, started in slots:
+                queue.release(started)
+            session.turn_lock.release()
+            raise
+        return AdmissionTicket(session.turn_lock, slots)
+
+# 전역 입장 제어 인스턴스
+admission_controller = AdmissionController(
+    {
+        "openai": ProviderQueue("openai", ADMISSION_OPENAI_CONCURRENCY),
+        "gemini": ProviderQueue("gemini", ADMISSION_GEMINI_CONCURRENCY),
+    },
+    KeyRateLimiter()
+)
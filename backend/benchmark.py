@@ -0,0 +1,302 @@
+"""
+채팅 파이프라인 오프라인 벤치마크
+
+실제 OpenAI/Gemini 대신 지연 시간과 토큰 속도를 조절할 수 있는 로컬 스텁 프로바이더를
+끼워 넣고, FastAPI 앱을 통해 /chat, /chat-2person, 초기 인사 엔드포인트를 호출합니다.
+대화 길이와 동시 세션 수를 늘려가며 p50/p95/p99 지연, 처리량, 이벤트 루프 지연, RSS를 출력합니다.
+
+사용 예:
+    python benchmark.py
+    python benchmark.py --latency-ms 200 --token-rate 50 --sessions 1,10,100 --turns 10,60
+    python benchmark.py --latency-ms 0 --token-rate 0 --json   # 자체 코드 오버헤드만 측정
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import argparse
+import resource
+from typing import AsyncIterator, Dict, List, Optional
+
+# 실제 키 없이도 모든 엔드포인트가 동작하도록 더미 키 설정 (main import 전에)
+os.environ.setdefault("OPENAI_API_KEY", "benchmark-openai-key")
+os.environ.setdefault("GEMINI_API_KEY", "benchmark-gemini-key")
+os.environ.setdefault("SUMMARY_DEBOUNCE_SECONDS", "0.5")
+os.environ.setdefault("CONVERSATION_DB_PATH", "")  # 벤치마크는 디스크에 기록하지 않음
+# 모든 세션이 같은 더미 키를 쓰므로 키별 속도 제한은 사실상 끔 (프로바이더 대기열 제한은 유지)
+os.environ.setdefault("ADMISSION_KEY_RATE", "1000000")
+os.environ.setdefault("ADMISSION_KEY_BURST", "1000000")
+
+import httpx
+
+class StubProvider:
+    """네트워크 없이 결정적인 응답을 돌려주는 스텁 프로바이더"""
+
+    def __init__(self, speaker: str, latency_ms: float = 300, token_rate: float = 0, reply_tokens: int = 60):
+        self.speaker = speaker
+        self.model = f"stub-{speaker}"
+        self.latency = latency_ms / 1000
+        self.token_rate = token_rate  # 초당 토큰 수 (0이면 토큰 생성 시간 없음)
+        self.reply_tokens = reply_tokens
+        self.calls = 0
+        self.prompt_chars = 0
+
+    def _reply_tokens(self, prompt: str) -> List[str]:
+        digest = hashlib.sha1(prompt.encode('utf-8')).hexdigest()
+        words = [digest[i:i + 6] for i in range(0, len(digest), 6)]
+        return [f"{self.speaker}:"] + [f" {words[i % len(words)]}" for i in range(self.reply_tokens - 1)]
+
+    def _token_delay(self) -> float:
+        return 1 / self.token_rate if self.token_rate > 0 else 0
+
+    def _record(self, prompt: str):
+        self.calls += 1
+        self.prompt_chars += len(prompt)
+
+    async def _complete(self, prompt: str) -> str:
+        self._record(prompt)
+        tokens = self._reply_tokens(prompt)
+        await asyncio.sleep(self.latency + self._token_delay() * len(tokens))
+        return "".join(tokens)
+
+    async def _stream(self, prompt: str) -> AsyncIterator[str]:
+        self._record(prompt)
+        await asyncio.sleep(self.latency)
+        delay = self._token_delay()
+        for token in self._reply_tokens(prompt):
+            if delay:
+                await asyncio.sleep(delay)
+            yield token
+
+    # OpenAIProvider 인터페이스
+    async def chat(self, api_key: str, messages: List[Dict], **params) -> str:
+        return await self._complete(json.dumps(messages, ensure_ascii=False))
+
+    def stream_chat(self, api_key: str, messages: List[Dict], **params) -> AsyncIterator[str]:
+        return self._stream(json.dumps(messages, ensure_ascii=False))
+
+    # GeminiProvider 인터페이스
+    async def generate(self, prompt: str, max_output_tokens: Optional[int] = None) -> str:
+        return await self._complete(prompt)
+
+    def stream_generate(self, prompt: str) -> AsyncIterator[str]:
+        return self._stream(prompt)
+
+def install_stub_providers(app_module, latency_ms: float, token_rate: float, reply_tokens: int) -> Dict[str, StubProvider]:
+    """main 모듈의 프로바이더를 스텁으로 교체"""
+    stubs = {
+        "openai": StubProvider("👩 Jinny", latency_ms, token_rate, reply_tokens),
+        "gemini": StubProvider("👨 Tom", latency_ms, token_rate, reply_tokens),
+    }
+    app_module.openai_provider = stubs["openai"]
+    app_module.gemini_provider = stubs["gemini"]
+    app_module.summary_worker.provider = stubs["openai"]
+    return stubs
+
+def percentile(values: List[float], pct: float) -> float:
+    """정렬 후 최근접 순위 백분위수"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+def current_rss_mb() -> float:
+    """현재 프로세스 RSS (MB)"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # /proc가 없으면 최대 RSS로 대체 (macOS는 바이트, Linux는 KB 단위)
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss / (1024 * 1024) if sys.platform == "darwin" else max_rss / 1024
+
+class LoopLagMonitor:
+    """주기적으로 잠들었다 깨어나는 시간 차이로 이벤트 루프 지연 측정"""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.samples: List[float] = []
+        self._task = None
+
+    async def _run(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, time.perf_counter() - started - self.interval))
+
+    def start(self):
+        self.samples = []
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+ENDPOINT_PAYLOADS = {
+    "/chat": lambda session_id, turn: {
+        "message": f"I really love watching dating shows, what do you think about episode {turn}?",
+        "session_id": session_id
+    },
+    "/chat-2person": lambda session_id, turn: {
+        "message": f"Can you teach me how to say my favorite food number {turn} in English?",
+        "session_id": session_id
+    },
+    "/initial-greeting": lambda session_id, turn: {},
+    "/initial-greeting-2person": lambda session_id, turn: {},
+}
+
+async def run_scenario(app, endpoint: str, sessions: int, turns: int) -> Dict:
+    """세션 N개가 동시에 각자 T턴씩 대화하는 시나리오 실행"""
+    latencies: List[float] = []
+    errors = 0
+    monitor = LoopLagMonitor()
+    make_payload = ENDPOINT_PAYLOADS[endpoint]
+    run_id = f"{endpoint.strip('/')}-{sessions}-{turns}-{time.monotonic_ns()}"
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://benchmark", timeout=None) as client:
+        async def session_loop(index: int):
+            nonlocal errors
+            session_id = f"{run_id}-{index}"
+            for turn in range(turns):
+                started = time.perf_counter()
+                response = await client.post(endpoint, json=make_payload(session_id, turn))
+                latencies.append(time.perf_counter() - started)
+                if response.status_code != 200:
+                    errors += 1
+
+        monitor.start()
+        started = time.perf_counter()
+        await asyncio.gather(*(session_loop(i) for i in range(sessions)))
+        elapsed = time.perf_counter() - started
+        await monitor.stop()
+
+    return {
+        "endpoint": endpoint,
+        "sessions": sessions,
+        "turns": turns,
+        "requests": len(latencies),
+        "errors": errors,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "throughput_rps": len(latencies) / elapsed if elapsed > 0 else 0.0,
+        "loop_lag_p99_ms": percentile(monitor.samples, 99) * 1000,
+        "loop_lag_max_ms": max(monitor.samples, default=0.0) * 1000,
+        "rss_mb": current_rss_mb(),
+    }
+
+def run_stage_benchmarks(app_module, history_lengths: List[int], iterations: int) -> List[Dict]:
+    """프롬프트 조립/압축 단계만 따로 측정 (프로바이더 호출 없음)"""
+    from session_store import ConversationSession
+
+    results = []
+    for length in history_lengths:
+        session = ConversationSession(f"stage-{length}")
+        for turn in range(length):
+            app_module.add_to_history(
+                session, "jinny",
+                f"👩 Jinny: That's amazing! Which couple impressed you the most in episode {turn}? (가장 인상적인 커플은?)",
+                f"I watched the cooking show and the dating reality program number {turn} yesterday"
+            )
+        stages = {
+            "build_jinny_messages": lambda: app_module.build_jinny_messages(session, "What do you recommend?"),
+            "build_tom_prompt": lambda: app_module.build_tom_prompt(session, "What do you recommend?"),
+            "build_2person_prompt": lambda: app_module.build_2person_prompt(session, "What do you recommend?"),
+            "compress_history": lambda: app_module.compress_history(session),
+        }
+        for stage, func in stages.items():
+            history_messages = len(session.full_conversation)
+            started = time.perf_counter()
+            for _ in range(iterations):
+                func()
+            elapsed = time.perf_counter() - started
+            results.append({
+                "stage": stage,
+                "history_messages": history_messages,
+                "mean_us": elapsed / iterations * 1e6,
+            })
+    return results
+
+def parse_int_list(value: str) -> List[int]:
+    return [int(item) for item in value.split(",") if item.strip()]
+
+def print_table(rows: List[Dict], columns: List[str]):
+    widths = {col: max(len(col), *(len(f"{row[col]:.1f}" if isinstance(row[col], float) else str(row[col])) for row in rows)) for col in columns}
+    print("  ".join(col.ljust(widths[col]) for col in columns))
+    for row in rows:
+        print("  ".join(
+            (f"{row[col]:.1f}" if isinstance(row[col], float) else str(row[col])).ljust(widths[col])
+            for col in columns
+        ))
+
+async def main_async(args) -> Dict:
+    logging.disable(logging.CRITICAL)
+    import main as app_module
+    logging.disable(logging.CRITICAL)
+
+    stubs = install_stub_providers(app_module, args.latency_ms, args.token_rate, args.reply_tokens)
+
+    scenarios = []
+    for endpoint in args.endpoints.split(","):
+        for sessions in parse_int_list(args.sessions):
+            for turns in parse_int_list(args.turns):
+                # 초기 인사는 대화 길이와 무관하므로 한 번씩만
+                if endpoint.startswith("/initial-greeting") and turns != parse_int_list(args.turns)[0]:
+                    continue
+                scenarios.append(await run_scenario(app_module.app, endpoint, sessions, turns))
+
+    stage_results = run_stage_benchmarks(app_module, parse_int_list(args.history_lengths), args.stage_iterations)
+    await app_module.summary_worker.shutdown()
+    await app_module.greeting_cache.shutdown()
+
+    return {
+        "config": vars(args),
+        "scenarios": scenarios,
+        "stages": stage_results,
+        "provider_calls": {name: stub.calls for name, stub in stubs.items()},
+        "provider_prompt_chars": {name: stub.prompt_chars for name, stub in stubs.items()},
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="AI Dude 채팅 파이프라인 오프라인 벤치마크")
+    parser.add_argument("--latency-ms", type=float, default=300, help="스텁 프로바이더 첫 토큰까지 지연 (ms)")
+    parser.add_argument("--token-rate", type=float, default=0, help="스텁 프로바이더 초당 토큰 수 (0이면 즉시)")
+    parser.add_argument("--reply-tokens", type=int, default=60, help="스텁 응답 토큰 수")
+    parser.add_argument("--endpoints", default="/chat,/chat-2person,/initial-greeting,/initial-greeting-2person")
+    parser.add_argument("--sessions", default="1,10,50", help="동시 세션 수 목록")
+    parser.add_argument("--turns", default="5,40", help="세션당 턴 수 목록 (대화 길이)")
+    parser.add_argument("--history-lengths", default="10,50,200", help="단계별 측정에 사용할 히스토리 턴 수")
+    parser.add_argument("--stage-iterations", type=int, default=200)
+    parser.add_argument("--json", action="store_true", help="결과를 JSON으로 출력")
+    args = parser.parse_args()
+
+    results = asyncio.run(main_async(args))
+
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+        return
+
+    print("=== Endpoint scenarios ===")
+    print_table(results["scenarios"], [
+        "endpoint", "sessions", "turns", "requests", "errors", "p50_ms", "p95_ms", "p99_ms",
+        "throughput_rps", "loop_lag_p99_ms", "loop_lag_max_ms", "rss_mb"
+    ])
+    print()
+    print("=== Pipeline stages (no provider calls) ===")
+    print_table(results["stages"], ["stage", "history_messages", "mean_us"])
+    print()
+    print(f"Provider calls: {results['provider_calls']}")
+    print(f"Provider prompt chars: {results['provider_prompt_chars']}")
+
+if __name__ == "__main__":
+    main()
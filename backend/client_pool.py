@@ -0,0 +1,69 @@
+import os
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Optional
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+logger = logging.getLogger(__name__)
+
+# 클라이언트 풀 설정
+OPENAI_CLIENT_POOL_SIZE = int(os.getenv("OPENAI_CLIENT_POOL_SIZE", "32"))
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "200"))
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", "50"))
+OPENAI_KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY_SECONDS", "30"))
+
+def hash_api_key(api_key: str) -> str:
+    """API 키를 그대로 보관하지 않도록 해시로 변환"""
+    return hashlib.sha256(api_key.encode('utf-8')).hexdigest()
+
+class OpenAIClientPool:
+    """API 키별 AsyncOpenAI 클라이언트 풀 (LRU, 커넥션 풀 공유)"""
+
+    def __init__(self, max_size: int = OPENAI_CLIENT_POOL_SIZE, http_client: Optional[httpx.AsyncClient] = None):
+        self.max_size = max_size
+        self._http_client = http_client
+        self._clients: "OrderedDict[str, AsyncOpenAI]" = OrderedDict()
+
+    @property
+    def http_client(self) -> httpx.AsyncClient:
+        """모든 클라이언트가 공유하는 keep-alive HTTP 커넥션 풀"""
+        if self._http_client is None:
+            self._http_client = DefaultAsyncHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=OPENAI_MAX_CONNECTIONS,
+                    max_keepalive_connections=OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY_SECONDS
+                )
+            )
+        return self._http_client
+
+    def get(self, api_key: str) -> AsyncOpenAI:
+        """API 키에 해당하는 클라이언트 반환 (없으면 생성)"""
+        key = hash_api_key(api_key)
+        client = self._clients.get(key)
+        if client is not None:
+            self._clients.move_to_end(key)
+            return client
+
+        client = AsyncOpenAI(api_key=api_key, http_client=self.http_client)
+        self._clients[key] = client
+        # 커넥션 풀은 공유하므로 제거된 클라이언트는 닫지 않음
+        while len(self._clients) > self.max_size:
+            self._clients.popitem(last=False)
+            logger.info("OpenAI client evicted from pool (LRU)")
+        return client
+
+    async def aclose(self):
+        """공유 HTTP 커넥션 풀 종료"""
+        self._clients.clear()
+        if self._http_client is not None:
+            await self._http_client.aclose()
+            self._http_client = None
+
+    def __len__(self):
+        return len(self._clients)
+
+# 전역 OpenAI 클라이언트 풀 인스턴스
+openai_client_pool = OpenAIClientPool()
@@ -0,0 +1,131 @@
+import os
+import logging
+from functools import lru_cache
+from typing import Callable, Dict, List
+
+logger = logging.getLogger(__name__)
+
+# tiktoken이 설치되어 있으면 OpenAI 토큰 수를 정확히 계산 (선택 의존성)
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# 페르소나별 프롬프트 토큰 예산
+JINNY_CONTEXT_TOKENS = int(os.getenv("JINNY_CONTEXT_TOKENS", "3000"))
+TOM_CONTEXT_TOKENS = int(os.getenv("TOM_CONTEXT_TOKENS", "3000"))
+TWO_PERSON_CONTEXT_TOKENS = int(os.getenv("TWO_PERSON_CONTEXT_TOKENS", "3000"))
+
+# 예산 안에서 채우는 순서 (앞쪽일수록 우선)
+CONTEXT_PRIORITY = tuple(
+    section.strip() for section in os.getenv("CONTEXT_PRIORITY", "summary,recent,keywords").split(",")
+    if section.strip()
+)
+
+# OpenAI 채팅 메시지 하나당 포맷 오버헤드 (role 등)
+OPENAI_MESSAGE_OVERHEAD = 4
+
+# tiktoken이 없을 때 사용하는 문자당 토큰 추정치
+ASCII_CHARS_PER_TOKEN = 4
+NON_ASCII_TOKENS_PER_CHAR = {
+    "openai": 1.0,  # 한글은 대략 글자당 1토큰
+    "gemini": 0.7,
+}
+
+_encoding = None
+
+def _get_encoding():
+    """OpenAI 토크나이저 (한 번만 로드, 실패하면 추정치 사용)"""
+    global _encoding
+    if _encoding is None and tiktoken is not None:
+        try:
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            logger.warning(f"tiktoken encoding unavailable, falling back to estimate: {e}")
+            _encoding = False
+    return _encoding or None
+
+@lru_cache(maxsize=4096)
+def count_tokens(text: str, provider: str = "openai") -> int:
+    """프로바이더별 토큰 수 계산 (정확한 토크나이저가 없으면 추정)"""
+    if not text:
+        return 0
+    if provider == "openai":
+        encoding = _get_encoding()
+        if encoding is not None:
+            return len(encoding.encode(text))
+
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    non_ascii_chars = len(text) - ascii_chars
+    return int(ascii_chars / ASCII_CHARS_PER_TOKEN + non_ascii_chars * NON_ASCII_TOKENS_PER_CHAR.get(provider, 1.0)) + 1
+
+def truncate_to_tokens(text: str, max_tokens: int, provider: str = "openai") -> str:
+    """토큰 수가 max_tokens 이하가 되도록 텍스트 뒷부분을 자름"""
+    if count_tokens(text, provider) <= max_tokens:
+        return text
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if count_tokens(text[:mid], provider) <= max_tokens:
+            low = mid
+        else:
+            high = mid - 1
+    return text[:low]
+
+class ContextBuilder:
+    """토큰 예산 안에서 시스템 프롬프트/요약/키워드/최근 대화를 우선순위대로 채움"""
+
+    def __init__(self, provider: str, budget_tokens: int, priority: tuple = CONTEXT_PRIORITY,
+                 message_overhead: int = 0):
+        self.provider = provider
+        self.budget_tokens = budget_tokens
+        self.priority = priority
+        self.message_overhead = message_overhead  # 메시지/섹션 하나당 추가 토큰
+
+    def count(self, text: str) -> int:
+        return count_tokens(text, self.provider) + self.message_overhead
+
+    def pack(self, system_prompt: str, user_message: str, recent_messages: List[Dict],
+             render_message: Callable[[Dict], str], summary: str = "", keywords: str = "",
+             fixed_text: str = "") -> Dict:
+        """
+        예산 안에 들어가는 맥락만 골라서 반환
+
+        시스템 프롬프트와 고정 문구는 항상 포함하고, 현재 사용자 메시지는 남은 예산에 맞춰 자릅니다.
+        최근 대화는 가장 최근 메시지부터 채우고, 들어가지 않는 메시지를 만나면 멈춥니다.
+        """
+        used = self.count(system_prompt) + (self.count(fixed_text) if fixed_text else 0)
+
+        user_message = truncate_to_tokens(user_message, max(0, self.budget_tokens - used - self.message_overhead), self.provider)
+        used += self.count(user_message)
+
+        packed = {"summary": "", "keywords": "", "recent_messages": []}
+        for section in self.priority:
+            if section == "recent":
+                selected = []
+                for msg in reversed(recent_messages):
+                    if msg["role"] not in ("user", "assistant"):
+                        continue
+                    cost = self.count(render_message(msg))
+                    if used + cost > self.budget_tokens:
+                        break
+                    selected.append(msg)
+                    used += cost
+                packed["recent_messages"] = list(reversed(selected))
+            elif section in ("summary", "keywords"):
+                text = summary if section == "summary" else keywords
+                if not text:
+                    continue
+                cost = self.count(text)
+                if used + cost <= self.budget_tokens:
+                    packed[section] = text
+                    used += cost
+
+        packed["user_message"] = user_message
+        packed["tokens"] = used
+        return packed
+
+# 페르소나별 맥락 빌더
+jinny_context_builder = ContextBuilder("openai", JINNY_CONTEXT_TOKENS, message_overhead=OPENAI_MESSAGE_OVERHEAD)
+tom_context_builder = ContextBuilder("gemini", TOM_CONTEXT_TOKENS)
+two_person_context_builder = ContextBuilder("gemini", TWO_PERSON_CONTEXT_TOKENS)
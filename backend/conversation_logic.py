@@ -9,7 +9,7 @@ class ConversationLogic:
             "topic": None
         }
     
-    def decide_who_speaks(self, user_message: str, jinny_response: str, tom_response: str) -> str:
+    def decide_who_speaks(self, user_message: str, jinny_response: str = None, tom_response: str = None) -> str:
         """누가 말할지 결정하는 로직"""
         
         # 이름 호출 확인
@@ -44,11 +44,30 @@ class ConversationLogic:
             else:
                 return random.choice(["jinny_only", "tom_only", "both"])
     
-    def create_response(self, user_message: str, jinny_response: str, tom_response: str) -> str:
+    def plan_speakers(self, user_message: str) -> str:
+        """모델 호출 전에 누가 말할지 결정 (응답 내용이 필요 없음)"""
+        name_detection = self.detect_name_call(user_message)
+        
+        # 이름이 호출되었으면 해당 AI만 응답
+        if name_detection["is_direct_call"]:
+            if "jinny" in name_detection["called_names"]:
+                return "jinny_only"
+            return "tom_only"
+        
+        return self.decide_who_speaks(user_message)
+    
+    def create_response(self, user_message: str, jinny_response: str, tom_response: str, speaker_decision: str = None) -> str:
         """최종 응답 생성"""
         
-        # 누가 말할지 결정
-        speaker_decision = self.decide_who_speaks(user_message, jinny_response, tom_response)
+        # 누가 말할지 결정 (미리 결정된 경우 그대로 사용)
+        if speaker_decision is None:
+            speaker_decision = self.decide_who_speaks(user_message, jinny_response, tom_response)
+        
+        # 한쪽 응답이 없으면 (호출 생략 또는 실패) 있는 쪽만 사용
+        if jinny_response is None:
+            speaker_decision = "tom_only"
+        elif tom_response is None:
+            speaker_decision = "jinny_only"
         
         if speaker_decision == "both":
             self.conversation_state["last_speaker"] = "both"
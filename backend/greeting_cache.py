@@ -0,0 +1,99 @@
+import os
+import time
+import random
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Tuple
+from single_flight import single_flight, flight_key
+
+logger = logging.getLogger(__name__)
+
+# 첫 인사 캐시 설정
+GREETING_POOL_SIZE = int(os.getenv("GREETING_POOL_SIZE", "5"))
+GREETING_TTL_SECONDS = float(os.getenv("GREETING_TTL_SECONDS", "3600"))
+# 풀에 남은 인사가 이 개수 이하가 되면 백그라운드에서 다시 채움
+GREETING_REFILL_THRESHOLD = int(os.getenv("GREETING_REFILL_THRESHOLD", "2"))
+
+GreetingGenerator = Callable[[], Awaitable[str]]
+
+class GreetingCache:
+    """
+    페르소나 + 시청기록 fingerprint별로 미리 생성한 첫 인사 풀 (한 번 쓴 인사는 풀에서 제거)
+
+    풀과 생성 호출은 모든 사용자가 공유하므로 generate는 서버 API 키로만 호출해야 합니다.
+    """
+
+    def __init__(self, pool_size: int = GREETING_POOL_SIZE, ttl: float = GREETING_TTL_SECONDS,
+                 refill_threshold: int = GREETING_REFILL_THRESHOLD):
+        self.pool_size = pool_size
+        self.ttl = ttl
+        self.refill_threshold = refill_threshold
+        self._pools: Dict[Tuple[str, str], List[Tuple[str, float]]] = {}
+        self._refills: Dict[Tuple[str, str], asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _pool(self, persona: str, fingerprint: str) -> List[Tuple[str, float]]:
+        """만료된 인사와 이전 시청기록 버전의 풀을 정리하고 현재 풀 반환"""
+        for key in [key for key in self._pools if key[0] == persona and key[1] != fingerprint]:
+            del self._pools[key]
+
+        now = time.monotonic()
+        pool = [(text, created_at) for text, created_at in self._pools.get((persona, fingerprint), [])
+                if now - created_at < self.ttl]
+        self._pools[(persona, fingerprint)] = pool
+        return pool
+
+    async def get(self, persona: str, fingerprint: str, generate: GreetingGenerator) -> str:
+        """풀에서 인사 하나를 꺼냄 (비어 있으면 직접 생성), 풀이 줄어들면 백그라운드로 보충"""
+        pool = self._pool(persona, fingerprint)
+        if pool:
+            self.hits += 1
+            text, _ = pool.pop(random.randrange(len(pool)))
+        else:
+            self.misses += 1
+            # 풀이 빈 상태에서 동시에 들어온 요청은 생성 호출 하나를 공유
+            text = await single_flight.do(flight_key("greeting", persona, fingerprint), generate)
+
+        if len(pool) <= self.refill_threshold:
+            self.refill(persona, fingerprint, generate)
+        return text
+
+    def refill(self, persona: str, fingerprint: str, generate: GreetingGenerator):
+        """풀을 pool_size까지 채우는 백그라운드 작업 예약 (키당 하나만)"""
+        key = (persona, fingerprint)
+        task = self._refills.get(key)
+        if task is None or task.done():
+            self._refills[key] = asyncio.create_task(self._refill(key, generate))
+
+    async def _refill(self, key: Tuple[str, str], generate: GreetingGenerator):
+        persona, fingerprint = key
+        try:
+            missing = self.pool_size - len(self._pool(persona, fingerprint))
+            if missing <= 0:
+                return
+            results = await asyncio.gather(*(generate() for _ in range(missing)), return_exceptions=True)
+
+            # 생성하는 동안 시청기록이 바뀌어 풀이 정리되었으면 버림
+            if key not in self._pools:
+                return
+            now = time.monotonic()
+            pool = self._pools[key]
+            for result in results:
+                if isinstance(result, Exception):
+                    logger.error(f"Greeting pre-generation failed for {persona}: {type(result).__name__}: {result}")
+                elif len(pool) < self.pool_size:
+                    pool.append((result, now))
+            logger.info(f"Greeting pool refilled for {persona} ({len(pool)}/{self.pool_size})")
+        finally:
+            self._refills.pop(key, None)
+
+    async def shutdown(self):
+        """진행 중인 보충 작업 취소"""
+        tasks = list(self._refills.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+# 전역 첫 인사 캐시 인스턴스
+greeting_cache = GreetingCache()
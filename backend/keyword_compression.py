@@ -1,32 +1,95 @@
+import os
 import re
-from typing import List, Dict, Set
+import heapq
+from collections import Counter
+from typing import List, Dict, Optional, Set, Tuple
+from metrics import stage_seconds
+
+# 세션당 집계할 최대 키워드 수 (넘으면 빈도/최근 순 상위 절반만 남김)
+KEYWORD_MAX_TRACKED = int(os.getenv("KEYWORD_MAX_TRACKED", "500"))
+
+# 중요 키워드 목록
+IMPORTANT_WORDS = frozenset([
+    'like', 'love', 'hate', 'want', 'need', 'think', 'feel',
+    'good', 'bad', 'great', 'terrible', 'amazing', 'awful',
+    'food', 'movie', 'music', 'book', 'game', 'sport',
+    'family', 'friend', 'work', 'study', 'travel', 'cook'
+])
+
+ENGLISH_WORD_PATTERN = re.compile(r'\b[a-zA-Z]{4,}\b')
 
 class KeywordCompressor:
-    def __init__(self):
+    """대화 키워드 압축기 (이미 처리한 메시지는 다시 스캔하지 않음)"""
+
+    def __init__(self, max_tracked: int = KEYWORD_MAX_TRACKED):
         self.important_keywords = set()
         self.topic_keywords = set()
+        self.max_tracked = max_tracked
+        self.keyword_counts: Counter = Counter()  # 키워드별 등장 메시지 수
+        self.keyword_last_seen: Dict[str, int] = {}  # 키워드별 마지막 등장 메시지 seq
+        self.processed_seq = -1  # 키워드 집계에 반영된 마지막 메시지 seq
+        self._ranked: Optional[Tuple[int, List[str]]] = None  # (top_k, 상위 키워드) - 새 메시지가 반영되면 무효화
     
     def extract_keywords(self, text: str) -> List[str]:
         """텍스트에서 중요 키워드 추출"""
         # 영어 단어 추출
-        english_words = re.findall(r'\b[a-zA-Z]{4,}\b', text.lower())
+        english_words = ENGLISH_WORD_PATTERN.findall(text.lower())
         
         # 중요 키워드 필터링
-        important_words = [
-            'like', 'love', 'hate', 'want', 'need', 'think', 'feel',
-            'good', 'bad', 'great', 'terrible', 'amazing', 'awful',
-            'food', 'movie', 'music', 'book', 'game', 'sport',
-            'family', 'friend', 'work', 'study', 'travel', 'cook'
-        ]
-        
-        keywords = []
+        keywords = set()
         for word in english_words:
-            if word in important_words or len(word) > 5:
-                keywords.append(word)
+            if word in IMPORTANT_WORDS or len(word) > 5:
+                keywords.add(word)
         
-        return list(set(keywords))  # 중복 제거
+        return list(keywords)  # 중복 제거
+    
+    def reset(self):
+        """누적 키워드 집계 초기화"""
+        self.keyword_counts.clear()
+        self.keyword_last_seen.clear()
+        self.processed_seq = -1
+        self._ranked = None
     
-    def compress_conversation(self, messages: List[Dict], keep_recent: int = 8) -> Dict:
+    def update(self, messages: List[Dict]):
+        """아직 처리하지 않은 메시지만 키워드 집계에 반영 (seq 오름차순 가정)"""
+        new_messages = []
+        for msg in reversed(messages):
+            seq = msg.get("seq")
+            if seq is None:
+                continue  # 요약 등 seq 없는 시스템 메시지
+            if seq <= self.processed_seq:
+                break
+            new_messages.append(msg)
+        
+        for msg in reversed(new_messages):
+            if msg.get("role") != "system":
+                for keyword in self.extract_keywords(msg["content"]):
+                    self.keyword_counts[keyword] += 1
+                    self.keyword_last_seen[keyword] = msg["seq"]
+            self.processed_seq = msg["seq"]
+        
+        if new_messages:
+            self._ranked = None
+            if len(self.keyword_counts) > self.max_tracked:
+                self._prune()
+    
+    def _rank_key(self, keyword: str) -> Tuple[int, int]:
+        return self.keyword_counts[keyword], self.keyword_last_seen[keyword]
+    
+    def _prune(self):
+        """집계 테이블을 max_tracked의 절반으로 줄임 (정리는 가끔만 일어나므로 메시지당 비용은 일정)"""
+        keep = heapq.nlargest(self.max_tracked // 2, self.keyword_counts, key=self._rank_key)
+        self.keyword_counts = Counter({keyword: self.keyword_counts[keyword] for keyword in keep})
+        self.keyword_last_seen = {keyword: self.keyword_last_seen[keyword] for keyword in keep}
+    
+    def top_keywords(self, top_k: int = 10) -> List[str]:
+        """빈도 → 최근 등장 순으로 상위 키워드 반환 (새 메시지가 반영될 때까지 결과 재사용)"""
+        if self._ranked is None or self._ranked[0] != top_k:
+            self._ranked = (top_k, heapq.nlargest(top_k, self.keyword_counts, key=self._rank_key))
+        return list(self._ranked[1])
+    
+    @stage_seconds.timed(stage="keyword_compression")
+    def compress_conversation(self, messages: List[Dict], keep_recent: int = 8, top_k: int = 10) -> Dict:
         """대화를 키워드로 압축"""
         if len(messages) <= keep_recent:
             return {
@@ -37,17 +100,14 @@ class KeywordCompressor:
         # 최근 메시지는 유지
         recent_messages = messages[-keep_recent:]
         
-        # 오래된 메시지에서 키워드 추출
+        # 오래된 메시지 중 새로 밀려난 것만 키워드 집계에 반영
         old_messages = messages[:-keep_recent]
-        all_keywords = set()
-        
-        for msg in old_messages:
-            keywords = self.extract_keywords(msg["content"])
-            all_keywords.update(keywords)
+        self.update(old_messages)
+        top_keywords = self.top_keywords(top_k)
         
         # 키워드를 문장으로 변환
-        if all_keywords:
-            compressed_context = f"이전 대화에서 언급된 키워드: {', '.join(list(all_keywords)[:10])}"
+        if top_keywords:
+            compressed_context = f"이전 대화에서 언급된 키워드: {', '.join(top_keywords)}"
         else:
             compressed_context = "이전 대화가 있었습니다."
         
@@ -0,0 +1,128 @@
+import os
+import sys
+import json
+import atexit
+import queue
+import random
+import logging
+import logging.handlers
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Optional
+
+# 로깅 설정
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")  # json 또는 text
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_MAX_MESSAGE_CHARS = int(os.getenv("LOG_MAX_MESSAGE_CHARS", "1000"))
+LOG_MAX_TRACEBACK_CHARS = int(os.getenv("LOG_MAX_TRACEBACK_CHARS", "4000"))
+# 턴 단위 상세 로그 (사용자 메시지, 모델 응답 등)를 남길 턴 비율
+LOG_TURN_SAMPLE_RATE = float(os.getenv("LOG_TURN_SAMPLE_RATE", "0.1"))
+
+# 턴 단위 상세 로그 표시 (logger.info(..., extra=TURN_LOG))
+TURN_LOG = {"turn_log": True}
+
+# 현재 턴의 상세 로그를 남길지 (요청마다 한 번 결정해서 턴 로그 전체에 적용)
+_turn_sampled: ContextVar[Optional[bool]] = ContextVar("turn_sampled", default=None)
+
+# 표준 LogRecord 속성 (나머지는 extra로 전달된 필드)
+_RESERVED_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "turn_log"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+def truncate(text: str, limit: int, keep_tail: bool = False) -> str:
+    """긴 텍스트 자르기 (트레이스백은 마지막 부분이 중요하므로 뒤쪽 유지)"""
+    if limit <= 0 or len(text) <= limit:
+        return text
+    if keep_tail:
+        return f"[truncated {len(text) - limit} chars] ...{text[-limit:]}"
+    return f"{text[:limit]}... [truncated {len(text) - limit} chars]"
+
+def sample_turn(rate: Optional[float] = None) -> bool:
+    """현재 요청(턴)의 상세 로그를 남길지 결정"""
+    sampled = random.random() < (LOG_TURN_SAMPLE_RATE if rate is None else rate)
+    _turn_sampled.set(sampled)
+    return sampled
+
+class TurnSamplingFilter(logging.Filter):
+    """샘플링되지 않은 턴의 상세 로그 제거 (경고 이상은 항상 통과)"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not getattr(record, "turn_log", False) or record.levelno >= logging.WARNING:
+            return True
+        sampled = _turn_sampled.get()
+        if sampled is None:
+            sampled = random.random() < LOG_TURN_SAMPLE_RATE
+        return sampled
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """호출한 쪽에서는 메시지 포맷/자르기만 하고 큐에 넣음 (큐가 가득 차면 버림)"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.message = truncate(record.getMessage(), LOG_MAX_MESSAGE_CHARS)
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = truncate(logging.Formatter().formatException(record.exc_info), LOG_MAX_TRACEBACK_CHARS, keep_tail=True)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+class JsonFormatter(logging.Formatter):
+    """한 줄짜리 JSON 로그 레코드"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED_ATTRS:
+                payload[key] = value
+        if record.exc_text:
+            payload["exc"] = record.exc_text
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+def setup_logging():
+    """루트 로거를 큐 기반으로 설정 (실제 출력은 백그라운드 리스너 스레드에서)"""
+    global _listener
+    if _listener is not None:
+        return
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    if LOG_FORMAT == "json":
+        stream_handler.setFormatter(JsonFormatter())
+    else:
+        stream_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+
+    log_queue: queue.Queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    queue_handler = NonBlockingQueueHandler(log_queue)
+    queue_handler.addFilter(TurnSamplingFilter())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(LOG_LEVEL)
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+def shutdown_logging():
+    """큐에 남은 로그를 모두 출력하고 리스너 종료"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -1,26 +1,38 @@
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
-import openai
 import google.generativeai as genai
 import os
 import sys
-import traceback
 import logging
 import json
+import asyncio
+import time
+from typing import Dict, List, Optional
 from dotenv import load_dotenv
-from prompts import AI1_SYSTEM_PROMPT, AI2_SYSTEM_PROMPT, INITIAL_GREETING_PROMPT, CONVERSATION_PROMPT, TOM_SYSTEM_PROMPT
-from keyword_compression import KeywordCompressor
-from conversation_logic import conversation_logic
-
-# 로깅 설정 - 모든 로그를 콘솔에 출력
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(sys.stdout)
-    ]
+from prompt_cache import prompt_cache
+from session_store import session_store, conversation_storage, session_state_backend, ConversationSession, DEFAULT_SESSION_ID
+from providers import OpenAIProvider, GeminiProvider
+from client_pool import openai_client_pool, hash_api_key
+from summary_worker import SummaryWorker
+from greeting_cache import greeting_cache
+from semantic_cache import semantic_cache
+from speculation import speculative_nudges
+from viewing_history import viewing_history_index
+from single_flight import single_flight, flight_key
+from resilience import openai_guard, gemini_guard, call_with_fallback, stream_with_fallback, CircuitOpenError
+from metrics import (
+    registry, render_metrics, monitor_loop_lag, MetricsMiddleware,
+    stage_seconds, speaker_seconds, context_tokens, websocket_connections
 )
+from context_builder import jinny_context_builder, tom_context_builder, two_person_context_builder
+from admission import admission_controller, AdmissionRejected
+from logging_config import setup_logging, sample_turn, TURN_LOG
+
+# 로깅 설정 - 큐에 넣고 백그라운드 스레드에서 JSON으로 출력 (이벤트 루프를 막지 않음)
+setup_logging()
 logger = logging.getLogger(__name__)
 
 # 서버 시작 로그
@@ -52,62 +64,301 @@ else:
     logger.warning("No Gemini API key found in environment")
     gemini_model = None
 
-# 시청기록 데이터 로드
-def load_viewing_history():
+# 비동기 프로바이더 (프로바이더별 동시 호출 한도 적용)
+openai_provider = OpenAIProvider("gpt-3.5-turbo")
+gemini_provider = GeminiProvider(gemini_model) if gemini_model else None
+
+# 백그라운드 대화 요약 (요청 경로 밖에서 실행)
+summary_worker = SummaryWorker(openai_provider, session_store)
+
+# 프로바이더별 응답 타임아웃 (초)
+JINNY_TIMEOUT_SECONDS = float(os.getenv("JINNY_TIMEOUT_SECONDS", "30"))
+TOM_TIMEOUT_SECONDS = float(os.getenv("TOM_TIMEOUT_SECONDS", "30"))
+
+# /conversation-history 페이지 크기
+HISTORY_PAGE_DEFAULT_LIMIT = int(os.getenv("HISTORY_PAGE_DEFAULT_LIMIT", "100"))
+HISTORY_PAGE_MAX_LIMIT = int(os.getenv("HISTORY_PAGE_MAX_LIMIT", "500"))
+
+# WebSocket 대화 채널에서 사용자가 이 시간 (초) 동안 조용하면 Tom이 먼저 말을 건넴 (0이면 끔)
+WS_IDLE_NUDGE_SECONDS = float(os.getenv("WS_IDLE_NUDGE_SECONDS", "20"))
+
+async def call_with_timeout(name: str, coro, timeout: float):
+    """비동기 프로바이더 호출에 타임아웃 적용"""
+    started = time.perf_counter()
+    outcome = "ok"
     try:
-        with open('data/viewing_history.json', 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            logger.info("Viewing history loaded successfully")
-            return data
+        return await asyncio.wait_for(coro, timeout=timeout)
+    except asyncio.TimeoutError:
+        outcome = "timeout"
+        logger.error(f"{name} call timed out after {timeout}s")
+        raise
     except Exception as e:
-        logger.error(f"Error loading viewing history: {e}")
-        return None
+        outcome = "error"
+        logger.error(f"{name} call failed: {type(e).__name__}: {e}")
+        raise
+    finally:
+        speaker_seconds.observe(time.perf_counter() - started, speaker=name, outcome=outcome)
 
-viewing_history_data = load_viewing_history()
+async def openai_chat(api_key: str, messages: List[Dict], **params) -> str:
+    """OpenAI 호출 (같은 모델/메시지/파라미터 요청이 진행 중이면 결과 공유)"""
+    key = flight_key("openai", openai_provider.model, hash_api_key(api_key or ""), messages, params)
+    return await single_flight.do(key, lambda: openai_provider.chat(api_key, messages, **params))
 
-# 통합 대화 히스토리 저장소 (메모리 기반)
-conversation_history = {
-    "full_conversation": []  # 전체 대화를 순서대로 저장
-}
+async def gemini_generate(prompt: str) -> str:
+    """Gemini 호출 (같은 프롬프트 요청이 진행 중이면 결과 공유)"""
+    key = flight_key("gemini", getattr(gemini_provider.model, "model_name", None), prompt)
+    return await single_flight.do(key, lambda: gemini_provider.generate(prompt))
 
-# 압축 시스템 초기화
-keyword_compressor = KeywordCompressor()
+def messages_as_prompt(messages: List[Dict]) -> str:
+    """채팅 메시지를 단일 프롬프트로 변환 (Gemini로 대체 호출할 때)"""
+    lines = []
+    for msg in messages:
+        if msg["role"] == "system":
+            lines.append(msg["content"])
+        else:
+            lines.append(f"{'사용자' if msg['role'] == 'user' else 'AI'}: {msg['content']}")
+    return "\n\n".join(lines) + "\n\nAI:"
+
+def jinny_attempts(api_key: str, messages: List[Dict], stream: bool = False) -> List:
+    """Jinny 호출 순서 (OpenAI, 장애 시 Gemini)"""
+    if stream:
+        attempts = [(openai_guard, lambda: openai_provider.stream_chat(api_key, messages))]
+        if gemini_provider:
+            attempts.append((gemini_guard, lambda: gemini_provider.stream_generate(messages_as_prompt(messages))))
+    else:
+        attempts = [(openai_guard, lambda: openai_chat(api_key, messages))]
+        if gemini_provider:
+            attempts.append((gemini_guard, lambda: gemini_generate(messages_as_prompt(messages))))
+    return attempts
 
-def add_to_history(speaker: str, message: str, user_message: str = None):
+def tom_attempts(api_key: str, prompt: str, stream: bool = False) -> List:
+    """Tom 호출 순서 (Gemini, 장애 시 OpenAI)"""
+    fallback_messages = [{"role": "user", "content": prompt}]
+    if stream:
+        attempts = [(gemini_guard, lambda: gemini_provider.stream_generate(prompt))]
+        if api_key:
+            attempts.append((openai_guard, lambda: openai_provider.stream_chat(api_key, fallback_messages)))
+    else:
+        attempts = [(gemini_guard, lambda: gemini_generate(prompt))]
+        if api_key:
+            attempts.append((openai_guard, lambda: openai_chat(api_key, fallback_messages)))
+    return attempts
+
+@stage_seconds.timed(stage="history_write")
+def add_to_history(session: ConversationSession, speaker: str, message: str, user_message: str = None):
     """대화 히스토리에 메시지 추가 (순서대로)"""
     if user_message:
-        conversation_history["full_conversation"].append({
+        session.add_message({
             "role": "user",
             "content": user_message
         })
+        session.memory.add_message("user", user_message)
     
-    conversation_history["full_conversation"].append({
+    session.add_message({
         "role": "assistant",
         "speaker": speaker,
         "content": message
     })
+    session.memory.add_message("assistant", message, speaker)
 
-def get_recent_context(max_messages: int = 50):
-    """최근 대화 맥락 가져오기 (전체 대화) - 30분 대화 지원"""
-    return conversation_history["full_conversation"][-max_messages:] if conversation_history["full_conversation"] else []
-
-def clear_history():
+def clear_history(session: ConversationSession):
     """대화 히스토리 초기화"""
-    conversation_history["full_conversation"].clear()
+    session.clear()
 
-def compress_history():
+@stage_seconds.timed(stage="compress_history")
+def compress_history(session: ConversationSession):
     """대화 히스토리 스마트 압축 (중요한 대화는 유지)"""
-    if len(conversation_history["full_conversation"]) > 100:
+    if len(session.full_conversation) > 100:
         # 최근 30개는 유지, 나머지는 요약
-        recent_30 = conversation_history["full_conversation"][-30:]
-        older_messages = conversation_history["full_conversation"][:-30]
+        recent_30 = session.full_conversation[-30:]
+        older_messages = session.full_conversation[:-30]
         
-        # 요약 생성 (간단한 버전)
-        summary = f"이전 대화 요약: {len(older_messages)}개의 메시지가 있었습니다."
+        # 백그라운드 요약이 있으면 사용, 없으면 간단한 버전
+        if session.summary:
+            summary = f"이전 대화 요약: {session.summary}"
+        else:
+            summary = f"이전 대화 요약: {len(older_messages)}개의 메시지가 있었습니다."
         
-        conversation_history["full_conversation"] = [
+        session.replace_history([
             {"role": "system", "content": summary}
-        ] + recent_30
+        ] + recent_30)
+
+TOM_INSTRUCTION = "Tom이 사용자에게 독립적으로 응답하세요. Jinny의 응답을 참고하되, 별도의 메시지로 작성하세요. 메시지 앞에 '👨 Tom:'을 붙여서 화자를 명시하세요."
+
+# 사용자가 대답을 망설일 때 Tom이 먼저 끼어드는 메시지 (WebSocket 채널)
+TOM_NUDGE_USER_MESSAGE = "(사용자가 한동안 대답하지 않고 망설이고 있습니다)"
+TOM_NUDGE_INSTRUCTION = "사용자가 대답을 망설이고 있습니다. Tom이 자연스럽게 끼어들어 마지막 질문을 더 쉬운 말로 바꿔 주거나, 대답에 쓸 수 있는 영어 표현을 하나 알려주세요. 한두 문장으로 짧게 쓰고, 메시지 앞에 '👨 Tom:'을 붙여서 화자를 명시하세요."
+# 사용자가 도움을 요청했을 때 Tom이 주는 어휘 힌트
+TOM_HINT_USER_MESSAGE = "(사용자가 Tom에게 도움을 요청했습니다)"
+TOPIC_LABELS = {"food": "음식", "entertainment": "영상과 엔터테인먼트", "work_study": "일과 공부"}
+
+def tom_hint_instruction(topic: Optional[str]) -> str:
+    """현재 대화 주제에 맞춘 어휘 힌트 지시문"""
+    subject = f"지금 주제 ({TOPIC_LABELS.get(topic, topic)})" if topic else "지금 대화"
+    return (f"사용자가 {subject}에 대해 영어로 대답하는 데 도움을 요청했습니다. 바로 쓸 수 있는 영어 단어나 표현 2~3개를 "
+            "한국어 뜻과 짧은 예문과 함께 알려주세요. 메시지 앞에 '👨 Tom:'을 붙여서 화자를 명시하세요.")
+
+# Tom 도움말 종류별 (사용자 메시지 자리에 넣을 상황 설명, 지시문)
+TOM_HELP_PROMPTS = {
+    "nudge": lambda session: (TOM_NUDGE_USER_MESSAGE, TOM_NUDGE_INSTRUCTION),
+    "hint": lambda session: (TOM_HINT_USER_MESSAGE, tom_hint_instruction(session.logic.conversation_state.get("topic"))),
+}
+
+def keywords_context(compressed_data: Dict) -> str:
+    """압축된 키워드 맥락 문자열 (없으면 빈 문자열)"""
+    if compressed_data["compressed_context"] != "대화가 시작되었습니다.":
+        return f"이전 대화 맥락: {compressed_data['compressed_context']}"
+    return ""
+
+def summary_context(session: ConversationSession) -> str:
+    """백그라운드 요약 맥락 문자열 (없으면 빈 문자열)"""
+    return f"이전 대화 요약: {session.summary}" if session.summary else ""
+
+def render_context_line(msg: Dict, assistant_label: str = None) -> str:
+    """텍스트 프롬프트용 대화 한 줄"""
+    if msg["role"] == "user":
+        return f"사용자: {msg['content']}"
+    return f"{assistant_label or msg.get('speaker', 'AI')}: {msg['content']}"
+
+@stage_seconds.timed(stage="prompt_jinny")
+def build_jinny_messages(session: ConversationSession, user_message: str) -> List[Dict]:
+    """Jinny (OpenAI) 요청 메시지 구성 (토큰 예산 안에서)"""
+    jinny_system_prompt = prompt_cache.get("jinny")
+    
+    # 압축된 대화 맥락 사용
+    compressed_data = session.compressor.compress_conversation(
+        session.full_conversation, 
+        keep_recent=8
+    )
+    context = jinny_context_builder.pack(
+        jinny_system_prompt,
+        user_message,
+        compressed_data["recent_messages"],
+        lambda msg: msg["content"],
+        summary=summary_context(session),
+        keywords=keywords_context(compressed_data)
+    )
+    context_tokens.observe(context["tokens"], persona="jinny")
+    
+    # 시스템 프롬프트 + 요약 + 압축된 맥락
+    jinny_messages = [{"role": "system", "content": jinny_system_prompt}]
+    if context["summary"]:
+        jinny_messages.append({"role": "system", "content": context["summary"]})
+    if context["keywords"]:
+        jinny_messages.append({"role": "system", "content": context["keywords"]})
+    
+    # 최근 메시지 추가
+    for msg in context["recent_messages"]:
+        jinny_messages.append({"role": msg["role"], "content": msg["content"]})
+    
+    # 현재 사용자 메시지 추가
+    jinny_messages.append({"role": "user", "content": context["user_message"]})
+    return jinny_messages
+
+@stage_seconds.timed(stage="prompt_tom")
+def build_tom_prompt(session: ConversationSession, user_message: str, instruction: str = TOM_INSTRUCTION) -> str:
+    """Tom (Gemini) 프롬프트 구성 (Jinny와 같은 압축 맥락, 토큰 예산 안에서)"""
+    tom_system_prompt = prompt_cache.get("tom")
+    
+    # 압축된 대화 맥락 사용 (요약 + 키워드 + 최근 메시지)
+    compressed_data = session.compressor.compress_conversation(
+        session.full_conversation, 
+        keep_recent=8
+    )
+    context = tom_context_builder.pack(
+        tom_system_prompt,
+        user_message,
+        compressed_data["recent_messages"],
+        render_context_line,
+        summary=summary_context(session),
+        keywords=keywords_context(compressed_data),
+        fixed_text=instruction
+    )
+    context_tokens.observe(context["tokens"], persona="tom")
+    
+    tom_context_text = ""
+    if context["summary"]:
+        tom_context_text += f"\n\n{context['summary']}"
+    if context["keywords"]:
+        tom_context_text += f"\n\n{context['keywords']}"
+    if context["recent_messages"]:
+        context_messages = [render_context_line(ctx) for ctx in context["recent_messages"]]
+        tom_context_text += "\n\n최근 대화 맥락:\n" + "\n".join(context_messages)
+    
+    return f"{tom_system_prompt}{tom_context_text}\n\n사용자 메시지: {context['user_message']}\n\n{instruction}"
+
+@stage_seconds.timed(stage="prompt_2person")
+def build_2person_prompt(session: ConversationSession, user_message: str) -> str:
+    """2인 대화용 Gemini 프롬프트 구성 (토큰 예산 안에서)"""
+    gemini_system_prompt = prompt_cache.get("2person")
+    
+    # 압축된 대화 맥락 사용
+    compressed_data = session.compressor.compress_conversation(
+        session.full_conversation, 
+        keep_recent=8
+    )
+    context = two_person_context_builder.pack(
+        gemini_system_prompt,
+        user_message,
+        compressed_data["recent_messages"],
+        lambda msg: render_context_line(msg, "AI"),
+        summary=summary_context(session),
+        keywords=keywords_context(compressed_data)
+    )
+    context_tokens.observe(context["tokens"], persona="2person")
+    
+    # 요약 + 압축된 맥락 추가
+    context_text = ""
+    if context["summary"]:
+        context_text += f"\n\n{context['summary']}"
+    if context["keywords"]:
+        context_text += f"\n\n{context['keywords']}"
+    
+    # 최근 메시지 추가
+    recent_text = ""
+    for msg in context["recent_messages"]:
+        recent_text += render_context_line(msg, "AI") + "\n"
+    
+    return f"{gemini_system_prompt}{context_text}\n\n최근 대화:\n{recent_text}\n\n사용자: {context['user_message']}\n\nAI:"
+
+def turn_providers(use_jinny: bool, use_tom: bool) -> List[str]:
+    """이번 턴에 사용할 프로바이더 (입장 제어 대기열)"""
+    providers = []
+    if use_jinny:
+        providers.append("openai")
+    if use_tom:
+        providers.append("gemini")
+    return providers
+
+def cached_replies(speakers: List[str], message: str) -> Dict[str, str]:
+    """시맨틱 캐시에서 찾은 화자별 응답 (캐시가 꺼져 있으면 빈 dict)"""
+    if not semantic_cache.enabled:
+        return {}
+    replies = {}
+    with stage_seconds.time(stage="semantic_cache"):
+        for speaker in speakers:
+            reply = semantic_cache.get(speaker, prompt_cache.fingerprint, message)
+            if reply is not None:
+                replies[speaker] = reply
+    return replies
+
+async def cached_stream(text: str):
+    """캐시된 응답을 한 조각짜리 스트림으로 전달"""
+    yield text
+
+def admitted_stream(events, ticket) -> StreamingResponse:
+    """턴 이벤트를 SSE 응답으로 (스트림이 끝나거나 연결이 끊기면 입장 허가 반납)"""
+    async def release_after():
+        try:
+            async for event in events:
+                yield sse_event(event)
+        finally:
+            ticket.release()
+    return StreamingResponse(release_after(), media_type="text/event-stream", background=BackgroundTask(ticket.release))
+
+def sse_event(data: Dict) -> str:
+    """Server-Sent Events 한 건 직렬화"""
+    return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
 
 app = FastAPI(title="AI Chat Server", version="1.0.0")
 
@@ -121,9 +372,66 @@ app.add_middleware(
 )
 logger.info("CORS middleware configured")
 
+app.add_middleware(MetricsMiddleware)
+
+# 다른 모듈의 상태는 스크레이프할 때 읽어서 내보냄
+registry.callback("sessions_active", "Sessions held in memory", "gauge", lambda: {(): len(session_store)})
+registry.callback("session_state_conflicts_total", "Session saves that hit a version conflict and were rebased", "counter",
+                  lambda: {(): session_store.conflicts})
+registry.callback("greeting_cache_requests_total", "Greeting cache lookups", "counter",
+                  lambda: {("hit",): greeting_cache.hits, ("miss",): greeting_cache.misses}, ("result",))
+registry.callback("single_flight_calls_total", "Provider calls started or joined via single-flight", "counter",
+                  lambda: {("started",): single_flight.started, ("coalesced",): single_flight.coalesced}, ("result",))
+registry.callback("semantic_cache_requests_total", "Semantic response cache lookups", "counter",
+                  lambda: {("hit",): semantic_cache.hits, ("miss",): semantic_cache.misses}, ("result",))
+registry.callback("semantic_cache_entries", "Replies held in the semantic cache", "gauge", lambda: {(): len(semantic_cache)})
+registry.callback("speculative_help_total", "Speculatively generated Tom help by outcome", "counter",
+                  lambda: {("hit",): speculative_nudges.hits, ("miss",): speculative_nudges.misses,
+                           ("cancelled",): speculative_nudges.cancelled, ("over_budget",): speculative_nudges.over_budget},
+                  ("result",))
+registry.callback("speculative_help_tokens_total", "Estimated tokens reserved for speculative Tom help", "counter",
+                  lambda: {(): speculative_nudges.spent_tokens})
+registry.callback("admission_queue", "Turns active or waiting per provider queue", "gauge",
+                  lambda: {(name, state): getattr(queue, state)
+                           for name, queue in admission_controller.queues.items() for state in ("active", "waiting")},
+                  ("provider", "state"))
+registry.callback("admission_rejections_total", "Requests rejected with 429 by reason", "counter",
+                  lambda: {(reason,): count for reason, count in admission_controller.rejections.items()}, ("reason",))
+registry.callback("circuit_open", "Whether a provider circuit breaker is open (1) or half-open (0.5)", "gauge",
+                  lambda: {(guard.name,): {"closed": 0, "half_open": 0.5, "open": 1}[guard.breaker.state]
+                           for guard in (openai_guard, gemini_guard)}, ("provider",))
+
+loop_lag_task = None
+
+@app.on_event("startup")
+async def startup():
+    """첫 인사 풀을 미리 채워서 첫 페이지 로드도 바로 응답, 이벤트 루프 지연 측정 시작"""
+    global loop_lag_task
+    loop_lag_task = asyncio.create_task(monitor_loop_lag())
+    if default_openai_api_key:
+        greeting_cache.refill("greeting", prompt_cache.fingerprint, lambda: generate_jinny_greeting(default_openai_api_key))
+    if gemini_provider:
+        greeting_cache.refill("greeting_2person", prompt_cache.fingerprint, generate_2person_greeting)
+
+@app.on_event("shutdown")
+async def shutdown():
+    """백그라운드 작업과 공유 HTTP 커넥션 풀 정리, 남은 대화 기록 저장"""
+    if loop_lag_task:
+        loop_lag_task.cancel()
+    await summary_worker.shutdown()
+    await greeting_cache.shutdown()
+    await speculative_nudges.shutdown()
+    await openai_client_pool.aclose()
+    if session_state_backend is not None:
+        await session_state_backend.close()
+    if conversation_storage:
+        await asyncio.get_running_loop().run_in_executor(None, conversation_storage.close)
+    await asyncio.get_running_loop().run_in_executor(None, viewing_history_index.close)
+
 class ChatRequest(BaseModel):
     message: str
     api_key: str = None
+    session_id: str = DEFAULT_SESSION_ID
 
 class InitialGreetingRequest(BaseModel):
     api_key: str = None
@@ -143,28 +451,112 @@ async def test():
     logger.info("=== Test endpoint called ===")
     return {"message": "Test endpoint working!"}
 
+def admission_message(exc: AdmissionRejected) -> str:
+    """입장 거절 사유를 사용자용 메시지로 변환"""
+    if exc.reason == "session_busy":
+        return "이전 메시지에 대한 응답을 기다리는 중입니다. 잠시 후 다시 보내주세요."
+    return "요청이 많아 잠시 후 다시 시도해주세요."
+
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request: Request, exc: AdmissionRejected):
+    """입장 제어에 걸린 요청은 대기시키지 않고 바로 429 + Retry-After"""
+    return JSONResponse(
+        status_code=429,
+        content={"response": admission_message(exc), "reason": exc.reason},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus 텍스트 포맷 메트릭"""
+    return Response(content=render_metrics(), media_type="text/plain; version=0.0.4")
+
 @app.get("/viewing-history")
 async def get_viewing_history():
     logger.info("=== Viewing history endpoint called ===")
-    if viewing_history_data:
-        return viewing_history_data
+    if prompt_cache.viewing_history_data:
+        return prompt_cache.viewing_history_data
     else:
         return {"error": "Viewing history not available"}
 
 @app.post("/clear-conversation")
-async def clear_conversation():
+async def clear_conversation(session_id: str = DEFAULT_SESSION_ID):
     """대화 히스토리 초기화"""
     logger.info("=== Clear conversation endpoint called ===")
-    clear_history()
+    session = session_store.peek(session_id)
+    if session is None and (session_store.shares_state or session_store.storage):
+        # 다른 워커에서 진행했거나 재시작/제거 후 디스크에만 남은 세션일 수 있으므로 불러와서 초기화
+        session = await session_store.load(session_id)
+    if session:
+        clear_history(session)
+        await session_store.save(session)
     return {"message": "대화 히스토리가 초기화되었습니다."}
 
 @app.get("/conversation-history")
-async def get_conversation_history():
-    """현재 대화 히스토리 조회"""
+async def get_conversation_history(request: Request, session_id: str = DEFAULT_SESSION_ID,
+                                   after_turn: Optional[int] = None, limit: int = HISTORY_PAGE_DEFAULT_LIMIT,
+                                   since_version: Optional[int] = None):
+    """
+    대화 히스토리 조회
+
+    - 파라미터가 없으면 전체 히스토리
+    - after_turn: 해당 seq 이후 메시지를 limit개씩 (커서 페이지네이션)
+    - since_version: 이전 응답의 version 이후에 추가된 메시지만 (증분 조회)
+    응답의 ETag를 If-None-Match로 보내면 변경이 없을 때 304를 반환합니다.
+    """
     logger.info("=== Conversation history endpoint called ===")
-    return {
-        "full_conversation": conversation_history["full_conversation"]
+    session = await session_store.find(session_id)
+    if session is None:
+        return {"full_conversation": [], "version": 0, "generation": 0, "has_more": False}
+    
+    # ETag는 페이지/커서마다 달라야 하므로 정규화한 조회 조건도 포함
+    paged = after_turn is not None or since_version is not None
+    if paged:
+        after_seq = after_turn if after_turn is not None else since_version - 1
+        limit = max(1, min(limit, HISTORY_PAGE_MAX_LIMIT))
+    etag = session.history_etag(f"{after_seq}:{limit}" if paged else "")
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    
+    if not paged:
+        messages = session.full_conversation
+        has_more = False
+    else:
+        messages = session.messages_after(after_seq, limit + 1)
+        has_more = len(messages) > limit
+        messages = messages[:limit]
+    
+    body = {
+        "full_conversation": messages,
+        "version": session.next_seq,  # 다음 증분 조회 때 since_version으로 사용
+        "generation": session.generation,  # 바뀌면 대화가 초기화된 것
+        "has_more": has_more,
     }
+    if messages and messages[-1].get("seq") is not None:
+        body["next_after_turn"] = messages[-1]["seq"]
+    return Response(
+        content=json.dumps(body, ensure_ascii=False),
+        media_type="application/json",
+        headers={"ETag": etag}
+    )
+
+async def generate_jinny_greeting(api_key: str) -> str:
+    """시청기록 기반 Jinny 첫 인사 생성"""
+    logger.info("Calling OpenAI API for initial greeting...", extra=TURN_LOG)
+    return await openai_provider.chat(
+        api_key,
+        [
+            {"role": "system", "content": prompt_cache.get("greeting")},
+            {"role": "user", "content": "안녕하세요"}
+        ]
+    )
+
+async def generate_2person_greeting() -> str:
+    """시청기록 기반 2인 대화 첫 인사 생성"""
+    logger.info("Calling Gemini API for 2-person initial greeting...", extra=TURN_LOG)
+    return await gemini_provider.generate(
+        f"{prompt_cache.get('greeting_2person')}\n\n사용자: 안녕하세요\n\nAI:"
+    )
 
 @app.post("/initial-greeting")
 async def initial_greeting(request: InitialGreetingRequest):
@@ -178,44 +570,24 @@ async def initial_greeting(request: InitialGreetingRequest):
             logger.error("No OpenAI API key available")
             return {"response": "OpenAI API 키가 설정되지 않았습니다."}
         
-        logger.info("Setting OpenAI API key...")
-        openai.api_key = api_key_to_use
-        
-        # 시청기록 기반 첫 인사 생성 (AI1이 담당)
-        if viewing_history_data:
-            top_interests = viewing_history_data.get('top_interests', [])
-            favorite_category = viewing_history_data.get('favorite_category', '')
-            recent_videos = viewing_history_data.get('viewing_history', [])[:3]
-            
-            viewing_history_info = f"""
-- 주요 관심사: {', '.join(top_interests)}
-- 가장 좋아하는 카테고리: {favorite_category}
-- 최근 시청 영상: {', '.join([video['title'] for video in recent_videos])}
-            """
-            
-            system_prompt = INITIAL_GREETING_PROMPT.format(viewing_history_info=viewing_history_info)
+        # 시청기록 기반 첫 인사 (AI1이 담당)
+        prompt_cache.refresh()
+        if api_key_to_use == default_openai_api_key:
+            # 모든 사용자가 공유하는 풀은 서버 키로만 채움
+            ai_response = await greeting_cache.get(
+                "greeting", prompt_cache.fingerprint, lambda: generate_jinny_greeting(default_openai_api_key)
+            )
         else:
-            system_prompt = "당신은 AI DUDE의 대화 주도자 Jinny입니다. (여성) 사용자에게 자연스럽게 인사해주세요. 반드시 메시지 앞에 '👩 Jinny:'를 붙여서 화자를 명시하세요. 절대 'AI1:'이나 다른 이름을 사용하지 마세요."
-        
-        logger.info("Calling OpenAI API for initial greeting...")
-        response = openai.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": "안녕하세요"}
-            ]
-        )
-        
-        ai_response = response.choices[0].message.content
-        logger.info(f"OpenAI initial greeting: {ai_response}")
+            # 사용자 키로 생성한 인사는 그 사용자에게만 (다른 요청과 호출을 공유하지 않음)
+            ai_response = await generate_jinny_greeting(api_key_to_use)
+        logger.info(f"OpenAI initial greeting: {ai_response}", extra=TURN_LOG)
         return {"response": ai_response}
         
     except Exception as e:
         logger.error(f"=== Error in initial greeting endpoint ===")
         logger.error(f"Error type: {type(e).__name__}")
         logger.error(f"Error message: {str(e)}")
-        logger.error(f"Full traceback:")
-        logger.error(traceback.format_exc())
+        logger.error("Full traceback:", exc_info=True)
         
         return {"response": "안녕하세요! 저는 AI DUDE입니다. 무엇이든 물어보세요!"}
 
@@ -225,307 +597,593 @@ async def initial_greeting_2person(request: InitialGreetingRequest):
     logger.info("=== 2-person initial greeting endpoint called ===")
     
     try:
-        if not gemini_model:
+        if not gemini_provider:
             logger.error("No Gemini API available")
             return {"response": "Gemini API가 설정되지 않았습니다."}
         
-        # 시청기록 기반 첫 인사 생성
-        if viewing_history_data:
-            top_interests = viewing_history_data.get('top_interests', [])
-            favorite_category = viewing_history_data.get('favorite_category', '')
-            recent_videos = viewing_history_data.get('viewing_history', [])[:3]
-            
-            viewing_history_info = f"""
-- 주요 관심사: {', '.join(top_interests)}
-- 가장 좋아하는 카테고리: {favorite_category}
-- 최근 시청 영상: {', '.join([video['title'] for video in recent_videos])}
-            """
-            
-            system_prompt = f"""당신은 AI DUDE의 친근한 영어 대화 파트너입니다.
-
-사용자의 유튜브 시청기록을 분석한 결과를 바탕으로 사용자에게 인사해주세요.
-
-**시청기록 정보:**
-{viewing_history_info}
-
-**첫 인사 요구사항:**
-1. 사용자에게 친근하게 인사해주세요
-2. 구체적인 콘텐츠(예: "나는솔로")를 언급하세요
-3. 모든 대화는 영어로 진행하되, 한국어 설명을 포함하세요
-4. 친근하고 호기심 많은 톤으로 대화하세요
-5. 메시지 앞에 "🤖 AI:"를 붙여서 화자를 명시하세요
-
-**예시:**
-"🤖 AI: Hello! I'm your AI conversation partner! (안녕하세요! 저는 당신의 AI 대화 파트너예요!) I noticed you love watching dating shows like 'I'm Solo'! (당신이 '나는솔로' 같은 연애 프로그램을 좋아한다는 걸 알아냈어요!) Which couple impressed you the most? (어떤 커플이 가장 인상적이었나요?)"
-"""
-        else:
-            system_prompt = "당신은 AI DUDE의 친근한 영어 대화 파트너입니다. 사용자에게 자연스럽게 인사해주세요. 메시지 앞에 '🤖 AI:'를 붙여서 화자를 명시하세요."
-        
-        logger.info("Calling Gemini API for 2-person initial greeting...")
-        response = gemini_model.generate_content(
-            f"{system_prompt}\n\n사용자: 안녕하세요\n\nAI:"
+        # 시청기록 기반 첫 인사 (미리 생성한 풀에서 꺼냄)
+        prompt_cache.refresh()
+        ai_response = await greeting_cache.get(
+            "greeting_2person", prompt_cache.fingerprint, generate_2person_greeting
         )
-        
-        ai_response = response.text
-        logger.info(f"Gemini 2-person initial greeting: {ai_response}")
+        logger.info(f"Gemini 2-person initial greeting: {ai_response}", extra=TURN_LOG)
         return {"response": ai_response}
         
     except Exception as e:
         logger.error(f"=== Error in 2-person initial greeting endpoint ===")
         logger.error(f"Error type: {type(e).__name__}")
         logger.error(f"Error message: {str(e)}")
-        logger.error(f"Full traceback:")
-        logger.error(traceback.format_exc())
+        logger.error("Full traceback:", exc_info=True)
         
         return {"response": "안녕하세요! 저는 AI DUDE입니다. 무엇이든 물어보세요!"}
 
 @app.post("/chat")
 async def chat(request: ChatRequest):
-    logger.info(f"=== Chat endpoint called ===")
-    logger.info(f"Received message: {request.message}")
+    sample_turn()
+    logger.info(f"=== Chat endpoint called ===", extra=TURN_LOG)
+    logger.info(f"Received message: {request.message}", extra=TURN_LOG)
     
     # API 키 결정 (프론트엔드에서 받은 키 우선, 없으면 환경변수)
     api_key_to_use = request.api_key if request.api_key else default_openai_api_key
+    ticket = None
     
     try:
-        if not api_key_to_use:
-            logger.error("No OpenAI API key available")
-            return {"response": "OpenAI API 키가 설정되지 않았습니다. 프론트엔드에서 API 키를 입력해주세요."}
-        
-        if not gemini_model:
-            logger.error("No Gemini API available")
-            return {"response": "Gemini API가 설정되지 않았습니다."}
+        session = await session_store.load(request.session_id)
+        conversation_logic = session.logic
         
-        logger.info("Setting OpenAI API key...")
-        openai.api_key = api_key_to_use
-        
-        # 시청기록 정보 준비
-        if viewing_history_data:
-            top_interests = viewing_history_data.get('top_interests', [])
-            favorite_category = viewing_history_data.get('favorite_category', '')
-            recent_videos = viewing_history_data.get('viewing_history', [])[:3]
-            
-            viewing_history_info = f"""
-- 주요 관심사: {', '.join(top_interests)}
-- 가장 좋아하는 카테고리: {favorite_category}
-- 최근 시청 영상: {', '.join([video['title'] for video in recent_videos])}
-            """
-        else:
-            viewing_history_info = "시청기록 정보가 없습니다."
+        # 모델 호출 전에 누가 말할지 결정 (버려질 응답은 생성하지 않음)
+        with stage_seconds.time(stage="speaker_decision"):
+            speaker_decision = conversation_logic.plan_speakers(request.message)
+        use_jinny = speaker_decision in ("jinny_only", "both")
+        use_tom = speaker_decision in ("tom_only", "both")
+        logger.info(f"Speaker decision: {speaker_decision}", extra=TURN_LOG)
         
-        # Jinny (OpenAI) 먼저 응답
-        logger.info("Calling OpenAI API for Jinny...")
-        jinny_system_prompt = f"""{AI1_SYSTEM_PROMPT}
-
-시청기록 정보:
-{viewing_history_info}
-
-Jinny가 사용자에게만 응답하세요. Tom에게 말을 걸지 마세요. 메시지 앞에 "👩 Jinny:"를 붙여서 화자를 명시하세요."""
+        unavailable = chat_unavailable_message(speaker_decision, api_key_to_use)
+        if unavailable:
+            return {"response": unavailable}
         
-        # Jinny 대화 히스토리 준비
-        jinny_messages = [{"role": "system", "content": jinny_system_prompt}]
+        # 자주 묻는 질문은 시맨틱 캐시에서 바로 응답 (캐시된 화자는 프로바이더 호출 안 함)
+        cached = cached_replies([speaker for speaker, used in (("jinny", use_jinny), ("tom", use_tom)) if used], request.message)
         
-        # 압축된 대화 맥락 사용
-        compressed_data = keyword_compressor.compress_conversation(
-            conversation_history["full_conversation"], 
-            keep_recent=8
+        # 입장 제어 (세션당 한 턴, 키별 속도 제한, 프로바이더 대기열) - 거절되면 429
+        ticket = await admission_controller.acquire(
+            session, api_key_to_use, turn_providers(use_jinny and "jinny" not in cached, use_tom and "tom" not in cached)
         )
         
-        # 시스템 프롬프트 + 압축된 맥락
-        jinny_messages = [{"role": "system", "content": jinny_system_prompt}]
-        
-        # 압축된 맥락 추가
-        if compressed_data["compressed_context"] != "대화가 시작되었습니다.":
-            jinny_messages.append({
-                "role": "system", 
-                "content": f"이전 대화 맥락: {compressed_data['compressed_context']}"
-            })
-        
-        # 최근 메시지 추가
-        for msg in compressed_data["recent_messages"]:
-            if msg["role"] == "user":
-                jinny_messages.append({"role": "user", "content": msg["content"]})
-            elif msg["role"] == "assistant":
-                jinny_messages.append({"role": "assistant", "content": msg["content"]})
-        
-        # 현재 사용자 메시지 추가
-        jinny_messages.append({"role": "user", "content": request.message})
-        
-        jinny_response = openai.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=jinny_messages
-        )
+        provider_calls = {}
+        if use_jinny and "jinny" not in cached:
+            jinny_messages = build_jinny_messages(session, request.message)
+            provider_calls["jinny"] = call_with_timeout(
+                "jinny",
+                call_with_fallback("jinny", jinny_attempts(api_key_to_use, jinny_messages), JINNY_TIMEOUT_SECONDS),
+                JINNY_TIMEOUT_SECONDS
+            )
+        if use_tom and "tom" not in cached:
+            tom_prompt = build_tom_prompt(session, request.message)
+            provider_calls["tom"] = call_with_timeout(
+                "tom",
+                call_with_fallback("tom", tom_attempts(api_key_to_use, tom_prompt), TOM_TIMEOUT_SECONDS),
+                TOM_TIMEOUT_SECONDS
+            )
         
-        jinny_message = jinny_response.choices[0].message.content
-        logger.info(f"Jinny response: {jinny_message}")
-        
-        # Tom (Gemini) 독립적 응답
-        logger.info("Calling Gemini API for Tom...")
-        tom_system_prompt = TOM_SYSTEM_PROMPT.format(viewing_history_info=viewing_history_info)
-        
-        # Tom 대화 히스토리 준비 (전체 대화 맥락)
-        recent_context = get_recent_context(50)
-        tom_context_text = ""
-        if recent_context:
-            context_messages = []
-            for ctx in recent_context:
-                if ctx["role"] == "user":
-                    context_messages.append(f"사용자: {ctx['content']}")
-                elif ctx["role"] == "assistant":
-                    speaker = ctx.get("speaker", "AI")
-                    context_messages.append(f"{speaker}: {ctx['content']}")
-            tom_context_text = "\n\n최근 대화 맥락:\n" + "\n".join(context_messages)
-        
-        tom_response = gemini_model.generate_content(
-            f"{tom_system_prompt}{tom_context_text}\n\n사용자 메시지: {request.message}\n\nTom이 사용자에게 독립적으로 응답하세요. Jinny의 응답을 참고하되, 별도의 메시지로 작성하세요. 메시지 앞에 '👨 Tom:'을 붙여서 화자를 명시하세요."
-        )
+        # 말할 AI만 호출 (둘 다 말하면 서로 의존하지 않으므로 동시에 호출)
+        logger.info(f"Calling providers concurrently: {list(provider_calls)}", extra=TURN_LOG)
+        results = dict(zip(
+            provider_calls,
+            await asyncio.gather(*provider_calls.values(), return_exceptions=True)
+        ))
+        for speaker, result in results.items():
+            if not isinstance(result, BaseException):
+                semantic_cache.put(speaker, prompt_cache.fingerprint, request.message, result)
+        results.update(cached)
         
-        tom_message = tom_response.text
-        logger.info(f"Tom response: {tom_message}")
+        # 부분 결과 처리: 한쪽만 실패하면 성공한 쪽 응답만 사용
+        errors = [result for result in results.values() if isinstance(result, BaseException)]
+        jinny_message = results.get("jinny")
+        tom_message = results.get("tom")
+        if isinstance(jinny_message, BaseException):
+            jinny_message = None
+        if isinstance(tom_message, BaseException):
+            tom_message = None
+        if jinny_message is None and tom_message is None:
+            raise errors[0]
         
-        # 대화 히스토리에 저장
-        add_to_history("jinny", jinny_message, request.message)
-        add_to_history("tom", tom_message, request.message)
+        logger.info(f"Jinny response: {jinny_message}", extra=TURN_LOG)
+        logger.info(f"Tom response: {tom_message}", extra=TURN_LOG)
         
-        # 히스토리가 너무 길어지면 압축
-        compress_history()
+        # 대화 히스토리에 저장 (사용자 메시지는 한 번만, 응답한 AI만)
+        user_message_to_record = request.message
+        for speaker, message in (("jinny", jinny_message), ("tom", tom_message)):
+            if message is not None:
+                add_to_history(session, speaker, message, user_message_to_record)
+                user_message_to_record = None
         
-        # 이름 호출 감지
-        name_detection = conversation_logic.detect_name_call(request.message)
+        # 히스토리가 너무 길어지면 압축, 오래된 대화는 백그라운드에서 요약
+        compress_history(session)
+        summary_worker.schedule(session, api_key_to_use)
         
-        # 대화 로직을 사용해서 자연스러운 응답 생성
+        # 대화 상태 업데이트 후 미리 정한 화자대로 응답 구성
         conversation_logic.update_conversation_state(request.message)
+        combined_response = conversation_logic.create_response(
+            request.message, jinny_message, tom_message, speaker_decision
+        )
+        await session_store.save(session)
         
-        # 이름이 호출되었으면 해당 AI만 응답
-        if name_detection["is_direct_call"]:
-            called_names = name_detection["called_names"]
-            if "jinny" in called_names:
-                combined_response = jinny_message
-                logger.info(f"Jinny called directly: {combined_response}")
-            elif "tom" in called_names:
-                combined_response = tom_message
-                logger.info(f"Tom called directly: {combined_response}")
-            else:
-                combined_response = conversation_logic.create_response(
-                    request.message, jinny_message, tom_message
-                )
-        else:
-            combined_response = conversation_logic.create_response(
-                request.message, jinny_message, tom_message
-            )
-        
-        logger.info(f"Response created: {combined_response}")
+        logger.info(f"Response created: {combined_response}", extra=TURN_LOG)
         return {"response": combined_response}
         
+    except AdmissionRejected:
+        raise
     except Exception as e:
         logger.error(f"=== Error in chat endpoint ===")
         logger.error(f"Error type: {type(e).__name__}")
         logger.error(f"Error message: {str(e)}")
-        logger.error(f"Full traceback:")
-        logger.error(traceback.format_exc())
-        
-        # 구체적인 에러 메시지 반환
-        if "api_key" in str(e).lower():
-            return {"response": "OpenAI API 키 오류입니다. 올바른 API 키를 입력해주세요."}
-        elif "rate_limit" in str(e).lower():
-            return {"response": "API 호출 한도를 초과했습니다. 잠시 후 다시 시도해주세요."}
+        logger.error("Full traceback:", exc_info=True)
+        
+        return {"response": chat_error_message(e)}
+    finally:
+        if ticket:
+            ticket.release()
+
+def chat_error_message(e: Exception) -> str:
+    """채팅 에러를 사용자용 메시지로 변환"""
+    # 구체적인 에러 메시지 반환
+    if isinstance(e, CircuitOpenError):
+        return "AI 서비스가 일시적으로 불안정합니다. 잠시 후 다시 시도해주세요."
+    elif "api_key" in str(e).lower():
+        return "OpenAI API 키 오류입니다. 올바른 API 키를 입력해주세요."
+    elif "rate_limit" in str(e).lower():
+        return "API 호출 한도를 초과했습니다. 잠시 후 다시 시도해주세요."
+    else:
+        return f"오류가 발생했습니다: {str(e)}"
+
+def chat_unavailable_message(speaker_decision: str, api_key: Optional[str]) -> Optional[str]:
+    """말할 AI의 프로바이더를 쓸 수 없으면 사용자용 안내 메시지"""
+    if speaker_decision in ("jinny_only", "both") and not api_key:
+        logger.error("No OpenAI API key available")
+        return "OpenAI API 키가 설정되지 않았습니다. 프론트엔드에서 API 키를 입력해주세요."
+    if speaker_decision in ("tom_only", "both") and not gemini_provider:
+        logger.error("No Gemini API available")
+        return "Gemini API가 설정되지 않았습니다."
+    return None
+
+async def open_chat_stream(session: ConversationSession, user_message: str, api_key: Optional[str], speaker_decision: str):
+    """3인 대화 스트리밍 턴 시작 (입장 허가와 턴 이벤트 제너레이터 반환, 거절되면 AdmissionRejected)"""
+    conversation_logic = session.logic
+    use_jinny = speaker_decision in ("jinny_only", "both")
+    use_tom = speaker_decision in ("tom_only", "both")
+    
+    cached = cached_replies([speaker for speaker, used in (("jinny", use_jinny), ("tom", use_tom)) if used], user_message)
+    ticket = await admission_controller.acquire(
+        session, api_key, turn_providers(use_jinny and "jinny" not in cached, use_tom and "tom" not in cached)
+    )
+    streams = {}
+    if "jinny" in cached:
+        streams["jinny"] = (cached_stream(cached["jinny"]), JINNY_TIMEOUT_SECONDS)
+    elif use_jinny:
+        jinny_messages = build_jinny_messages(session, user_message)
+        streams["jinny"] = (
+            stream_with_fallback("jinny", jinny_attempts(api_key, jinny_messages, stream=True)),
+            JINNY_TIMEOUT_SECONDS
+        )
+    if "tom" in cached:
+        streams["tom"] = (cached_stream(cached["tom"]), TOM_TIMEOUT_SECONDS)
+    elif use_tom:
+        tom_prompt = build_tom_prompt(session, user_message)
+        streams["tom"] = (
+            stream_with_fallback("tom", tom_attempts(api_key, tom_prompt, stream=True)),
+            TOM_TIMEOUT_SECONDS
+        )
+    
+    async def events():
+        messages = {}
+        
+        async def on_complete(speaker: str, message: str):
+            # 스트림이 끝난 화자부터 히스토리에 저장 (사용자 메시지는 처음 한 번만)
+            add_to_history(session, speaker, message, None if messages else user_message)
+            messages[speaker] = message
+            if speaker not in cached:
+                semantic_cache.put(speaker, prompt_cache.fingerprint, user_message, message)
+        
+        yield {"type": "start", "speakers": list(streams)}
+        async for event in merge_streams(streams, on_complete):
+            if event["type"] == "error":
+                event["message"] = chat_error_message(event.pop("exception"))
+            yield event
+        
+        if messages:
+            compress_history(session)
+            summary_worker.schedule(session, api_key)
+            conversation_logic.update_conversation_state(user_message)
+            combined_response = conversation_logic.create_response(
+                user_message, messages.get("jinny"), messages.get("tom"), speaker_decision
+            )
+            await session_store.save(session)
+            yield {"type": "done", "response": combined_response}
         else:
-            return {"response": f"오류가 발생했습니다: {str(e)}"}
+            yield {"type": "done", "response": None}
+    
+    return ticket, events()
+
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """Jinny/Tom 응답을 토큰 단위로 스트리밍 (SSE)"""
+    sample_turn()
+    logger.info(f"=== Chat stream endpoint called ===", extra=TURN_LOG)
+    logger.info(f"Received message: {request.message}", extra=TURN_LOG)
+    
+    api_key_to_use = request.api_key if request.api_key else default_openai_api_key
+    session = await session_store.load(request.session_id)
+    
+    with stage_seconds.time(stage="speaker_decision"):
+        speaker_decision = session.logic.plan_speakers(request.message)
+    logger.info(f"Speaker decision: {speaker_decision}", extra=TURN_LOG)
+    
+    unavailable = chat_unavailable_message(speaker_decision, api_key_to_use)
+    if unavailable:
+        return {"response": unavailable}
+    
+    ticket, events = await open_chat_stream(session, request.message, api_key_to_use, speaker_decision)
+    return admitted_stream(events, ticket)
+
+async def merge_streams(streams: Dict, on_complete):
+    """여러 화자의 토큰 스트림을 도착 순서대로 섞어서 전달"""
+    queue: asyncio.Queue = asyncio.Queue()
+    
+    async def pump(speaker: str, stream):
+        chunks = []
+        async for delta in stream:
+            chunks.append(delta)
+            await queue.put({"type": "delta", "speaker": speaker, "delta": delta})
+        return "".join(chunks)
+    
+    async def run(speaker: str, stream, timeout: float):
+        try:
+            message = await call_with_timeout(speaker, pump(speaker, stream), timeout)
+            await on_complete(speaker, message)
+            await queue.put({"type": "end", "speaker": speaker})
+        except Exception as e:
+            await queue.put({"type": "error", "speaker": speaker, "exception": e})
+        finally:
+            await queue.put(None)
+    
+    tasks = [asyncio.create_task(run(speaker, stream, timeout)) for speaker, (stream, timeout) in streams.items()]
+    try:
+        remaining = len(tasks)
+        while remaining:
+            event = await queue.get()
+            if event is None:
+                remaining -= 1
+                continue
+            yield event
+    finally:
+        # 클라이언트 연결이 끊기면 남은 스트림 취소
+        for task in tasks:
+            task.cancel()
 
 @app.post("/chat-2person")
 async def chat_2person(request: ChatRequest):
     """2인 관심사 기반 대화 (Gemini AI만 사용)"""
-    logger.info(f"=== 2-person chat endpoint called ===")
-    logger.info(f"Received message: {request.message}")
+    sample_turn()
+    logger.info(f"=== 2-person chat endpoint called ===", extra=TURN_LOG)
+    logger.info(f"Received message: {request.message}", extra=TURN_LOG)
+    ticket = None
     
     try:
-        if not gemini_model:
+        if not gemini_provider:
             logger.error("No Gemini API available")
             return {"response": "Gemini API가 설정되지 않았습니다."}
         
-        # 시청기록 정보 준비
-        if viewing_history_data:
-            top_interests = viewing_history_data.get('top_interests', [])
-            favorite_category = viewing_history_data.get('favorite_category', '')
-            recent_videos = viewing_history_data.get('viewing_history', [])[:3]
-            
-            viewing_history_info = f"""
-- 주요 관심사: {', '.join(top_interests)}
-- 가장 좋아하는 카테고리: {favorite_category}
-- 최근 시청 영상: {', '.join([video['title'] for video in recent_videos])}
-            """
-        else:
-            viewing_history_info = "시청기록 정보가 없습니다."
-        
-        # Gemini AI 전용 프롬프트
-        gemini_system_prompt = f"""당신은 AI DUDE의 친근한 영어 대화 파트너입니다.
-
-**역할과 책임:**
-1. 사용자의 관심사를 바탕으로 자연스럽게 대화하세요
-2. 모든 대화는 영어로 진행하되, 한국어 설명을 포함하세요
-3. 사용자가 어려워할 때 즉시 도움을 제공하세요
-4. 영어 학습에 대한 긍정적인 피드백을 제공하세요
-
-**대화 스타일:**
-- 따뜻하고 격려하는 톤
-- 사용자의 감정을 공감하고 지지
-- 자연스러운 대화 연결
-- 메시지 앞에 "🤖 AI:"를 붙여서 화자를 명시
-
-**시청기록 정보:**
-{viewing_history_info}
-
-**대화 규칙:**
-1. 모든 대화는 영어로 진행하되, 이해를 돕기 위해 한국어 설명을 포함하세요
-2. 시청기록의 관심사를 바탕으로 대화를 진행하세요
-3. 영어 표현을 사용할 때마다 한국어로 의미를 설명해주세요
-4. 메시지 앞에 "🤖 AI:"를 붙여서 화자를 명시하세요
-5. 친근하고 도움이 되는 톤으로 대화하세요
-"""
-        
-        # Gemini AI 응답
-        logger.info("Calling Gemini API for 2-person chat...")
-        
-        # 압축된 대화 맥락 사용
-        compressed_data = keyword_compressor.compress_conversation(
-            conversation_history["full_conversation"], 
-            keep_recent=8
-        )
-        
-        # 압축된 맥락 추가
-        context_text = ""
-        if compressed_data["compressed_context"] != "대화가 시작되었습니다.":
-            context_text = f"\n\n이전 대화 맥락: {compressed_data['compressed_context']}"
-        
-        # 최근 메시지 추가
-        recent_text = ""
-        for msg in compressed_data["recent_messages"]:
-            if msg["role"] == "user":
-                recent_text += f"사용자: {msg['content']}\n"
-            elif msg["role"] == "assistant":
-                recent_text += f"AI: {msg['content']}\n"
-        
-        gemini_response = gemini_model.generate_content(
-            f"{gemini_system_prompt}{context_text}\n\n최근 대화:\n{recent_text}\n\n사용자: {request.message}\n\nAI:"
-        )
+        session = await session_store.load(request.session_id)
+        cached = cached_replies(["2person"], request.message)
+        ticket = await admission_controller.acquire(session, default_openai_api_key, [] if cached else ["gemini"])
         
-        ai_message = gemini_response.text
-        logger.info(f"Gemini 2-person response: {ai_message}")
+        if cached:
+            ai_message = cached["2person"]
+        else:
+            # Gemini AI 응답
+            logger.info("Calling Gemini API for 2-person chat...", extra=TURN_LOG)
+            ai_message = await call_with_fallback(
+                "2person", tom_attempts(default_openai_api_key, build_2person_prompt(session, request.message)),
+                TOM_TIMEOUT_SECONDS
+            )
+            semantic_cache.put("2person", prompt_cache.fingerprint, request.message, ai_message)
+        logger.info(f"Gemini 2-person response: {ai_message}", extra=TURN_LOG)
         
         # 대화 히스토리에 저장
-        add_to_history("ai", ai_message, request.message)
-        compress_history()
+        add_to_history(session, "ai", ai_message, request.message)
+        compress_history(session)
+        summary_worker.schedule(session, default_openai_api_key)
+        await session_store.save(session)
         
         return {"response": ai_message}
         
+    except AdmissionRejected:
+        raise
     except Exception as e:
         logger.error(f"=== Error in 2-person chat endpoint ===")
         logger.error(f"Error type: {type(e).__name__}")
         logger.error(f"Error message: {str(e)}")
-        logger.error(f"Full traceback:")
-        logger.error(traceback.format_exc())
+        logger.error("Full traceback:", exc_info=True)
         
         return {"response": f"오류가 발생했습니다: {str(e)}"}
+    finally:
+        if ticket:
+            ticket.release()
+
+async def open_2person_stream(session: ConversationSession, user_message: str):
+    """2인 대화 스트리밍 턴 시작 (입장 허가와 턴 이벤트 제너레이터 반환, 거절되면 AdmissionRejected)"""
+    cached = cached_replies(["2person"], user_message)
+    ticket = await admission_controller.acquire(session, default_openai_api_key, [] if cached else ["gemini"])
+    if cached:
+        streams = {"ai": (cached_stream(cached["2person"]), TOM_TIMEOUT_SECONDS)}
+    else:
+        prompt = build_2person_prompt(session, user_message)
+        streams = {"ai": (
+            stream_with_fallback("2person", tom_attempts(default_openai_api_key, prompt, stream=True)),
+            TOM_TIMEOUT_SECONDS
+        )}
+    
+    async def events():
+        messages = {}
+        
+        async def on_complete(speaker: str, message: str):
+            add_to_history(session, speaker, message, None if messages else user_message)
+            messages[speaker] = message
+            if not cached:
+                semantic_cache.put("2person", prompt_cache.fingerprint, user_message, message)
+        
+        yield {"type": "start", "speakers": list(streams)}
+        async for event in merge_streams(streams, on_complete):
+            if event["type"] == "error":
+                event["message"] = f"오류가 발생했습니다: {str(event.pop('exception'))}"
+            yield event
+        
+        if messages:
+            compress_history(session)
+            summary_worker.schedule(session, default_openai_api_key)
+            await session_store.save(session)
+        yield {"type": "done", "response": messages.get("ai")}
+    
+    return ticket, events()
+
+@app.post("/chat-2person/stream")
+async def chat_2person_stream(request: ChatRequest):
+    """2인 대화 응답을 토큰 단위로 스트리밍 (SSE)"""
+    sample_turn()
+    logger.info(f"=== 2-person chat stream endpoint called ===", extra=TURN_LOG)
+    logger.info(f"Received message: {request.message}", extra=TURN_LOG)
+    
+    if not gemini_provider:
+        logger.error("No Gemini API available")
+        return {"response": "Gemini API가 설정되지 않았습니다."}
+    
+    session = await session_store.load(request.session_id)
+    ticket, events = await open_2person_stream(session, request.message)
+    return admitted_stream(events, ticket)
+
+def build_tom_help_prompt(session: ConversationSession, kind: str) -> str:
+    """Tom 도움말 프롬프트 (nudge: 망설일 때 끼어들기, hint: 주제 어휘 힌트)"""
+    situation, instruction = TOM_HELP_PROMPTS[kind](session)
+    return build_tom_prompt(session, situation, instruction)
+
+def schedule_speculative_help(session: ConversationSession):
+    """턴이 끝난 뒤 사용자가 고민하는 동안 Tom 도움말을 미리 생성 (Gemini 대기열이 밀려 있으면 생략)"""
+    if not speculative_nudges.enabled or not gemini_provider or admission_controller.queues["gemini"].waiting:
+        return
+    speculative_nudges.schedule(
+        session,
+        {kind: (lambda kind=kind: build_tom_help_prompt(session, kind)) for kind in TOM_HELP_PROMPTS},
+        lambda prompt: gemini_guard.call(
+            lambda: gemini_provider.generate(prompt, max_output_tokens=speculative_nudges.max_output_tokens),
+            TOM_TIMEOUT_SECONDS
+        )
+    )
+
+async def open_nudge_stream(session: ConversationSession, api_key: Optional[str], kind: str = "nudge"):
+    """
+    Tom이 먼저 건네는 도움말 (입장 허가와 턴 이벤트 제너레이터 반환, 거절되면 AdmissionRejected)
+
+    미리 생성해 둔 도움말이 있으면 프로바이더 호출 없이 바로 보냅니다.
+    """
+    speculated = speculative_nudges.take(session, kind)
+    ticket = await admission_controller.acquire(session, api_key, [] if speculated else ["gemini"])
+    if speculated:
+        streams = {"tom": (cached_stream(speculated), TOM_TIMEOUT_SECONDS)}
+    else:
+        prompt = build_tom_help_prompt(session, kind)
+        streams = {"tom": (
+            stream_with_fallback(f"tom_{kind}", tom_attempts(api_key, prompt, stream=True)),
+            TOM_TIMEOUT_SECONDS
+        )}
+    
+    async def events():
+        messages = {}
+        
+        async def on_complete(speaker: str, message: str):
+            add_to_history(session, speaker, message)
+            messages[speaker] = message
+        
+        yield {"type": "start", "speakers": list(streams)}
+        async for event in merge_streams(streams, on_complete):
+            if event["type"] == "error":
+                event["message"] = chat_error_message(event.pop("exception"))
+            yield event
+        
+        if messages:
+            session.logic.conversation_state["last_speaker"] = "tom"
+            await session_store.save(session)
+        yield {"type": "done", "response": messages.get("tom")}
+    
+    return ticket, events()
+
+@app.websocket("/ws")
+async def conversation_socket(websocket: WebSocket, session_id: str = DEFAULT_SESSION_ID, mode: str = "3person"):
+    """
+    세션별 WebSocket 대화 채널 (요청마다 HTTP 연결/CORS preflight 없이 연결 하나로 주고받음)
+
+    - 클라이언트 -> 서버: {"type": "message", "message": ..., "api_key": ...}, {"type": "typing"}, {"type": "help"}
+    - 서버 -> 클라이언트: 스트리밍 엔드포인트와 같은 턴 이벤트 (start, delta, end, error, done)
+    - 3인 대화에서 턴이 끝난 뒤 사용자가 WS_IDLE_NUDGE_SECONDS 동안 아무것도 보내지 않으면
+      Tom이 먼저 말을 건넴 (이벤트에 interjection: true). 사용자가 입력을 시작하면 취소 (done에 cancelled: true)
+    - help를 보내면 Tom이 현재 주제의 어휘 힌트를 줌 (SPECULATIVE_NUDGES_ENABLED면 미리 생성해 둔 것으로 바로 응답)
+    """
+    await websocket.accept()
+    two_person = mode == "2person"
+    api_key = default_openai_api_key
+    send_lock = asyncio.Lock()
+    turn_task: Optional[asyncio.Task] = None
+    nudge_task: Optional[asyncio.Task] = None
+    
+    async def send(event: Dict):
+        async with send_lock:
+            await websocket.send_json(event)
+    
+    async def send_rejected(message: str, reason: str = None, retry_after: int = None):
+        # 턴을 시작하지 못한 경우에도 클라이언트가 기다리지 않도록 done까지 전송
+        await send({"type": "error", "message": message, "reason": reason, "retry_after": retry_after})
+        await send({"type": "done", "response": None})
+    
+    async def stream_events(ticket, events, **extra):
+        try:
+            async for event in events:
+                event.update(extra)
+                await send(event)
+        finally:
+            ticket.release()
+    
+    async def run_turn(user_message: str, turn_api_key: Optional[str]):
+        sample_turn()
+        logger.info(f"WebSocket message ({mode}): {user_message}", extra=TURN_LOG)
+        try:
+            await start_turn(user_message, turn_api_key)
+        except Exception as e:
+            logger.error(f"WebSocket turn failed for session {session_id}: {type(e).__name__}: {e}")
+    
+    async def start_turn(user_message: str, turn_api_key: Optional[str]):
+        try:
+            session = await session_store.load(session_id)
+            if two_person:
+                if not gemini_provider:
+                    await send_rejected("Gemini API가 설정되지 않았습니다.")
+                    return
+                ticket, events = await open_2person_stream(session, user_message)
+            else:
+                with stage_seconds.time(stage="speaker_decision"):
+                    speaker_decision = session.logic.plan_speakers(user_message)
+                logger.info(f"Speaker decision: {speaker_decision}", extra=TURN_LOG)
+                unavailable = chat_unavailable_message(speaker_decision, turn_api_key)
+                if unavailable:
+                    await send_rejected(unavailable)
+                    return
+                ticket, events = await open_chat_stream(session, user_message, turn_api_key, speaker_decision)
+        except AdmissionRejected as e:
+            await send_rejected(admission_message(e), e.reason, e.retry_after)
+            return
+        await stream_events(ticket, events)
+        if not two_person:
+            schedule_speculative_help(session)
+        arm_nudge()
+    
+    async def run_help():
+        try:
+            session = await session_store.load(session_id)
+            ticket, events = await open_nudge_stream(session, api_key, "hint")
+        except AdmissionRejected as e:
+            await send_rejected(admission_message(e), e.reason, e.retry_after)
+            return
+        except Exception as e:
+            logger.error(f"Tom hint failed for session {session_id}: {type(e).__name__}: {e}")
+            return
+        try:
+            await stream_events(ticket, events, interjection=True)
+        except Exception as e:
+            logger.error(f"Tom hint failed for session {session_id}: {type(e).__name__}: {e}")
+    
+    async def nudge_after_idle():
+        await asyncio.sleep(WS_IDLE_NUDGE_SECONDS)
+        try:
+            session = await session_store.load(session_id)
+            ticket, events = await open_nudge_stream(session, api_key)
+        except AdmissionRejected as e:
+            logger.info(f"Tom nudge skipped for session {session_id} ({e.reason})")
+            return
+        except Exception as e:
+            logger.error(f"Tom nudge failed for session {session_id}: {type(e).__name__}: {e}")
+            return
+        logger.info(f"Tom nudge for idle session {session_id}")
+        started = False
+        try:
+            async for event in events:
+                started = True
+                event["interjection"] = True
+                await send(event)
+        except asyncio.CancelledError:
+            if started:
+                await send({"type": "done", "response": None, "interjection": True, "cancelled": True})
+            raise
+        except Exception as e:
+            logger.error(f"Tom nudge failed for session {session_id}: {type(e).__name__}: {e}")
+        finally:
+            ticket.release()
+    
+    def arm_nudge():
+        # 3인 대화에서만, 침묵 한 번에 한 번만 끼어듦
+        nonlocal nudge_task
+        if not two_person and gemini_provider and WS_IDLE_NUDGE_SECONDS > 0:
+            nudge_task = asyncio.create_task(nudge_after_idle())
+    
+    async def cancel_nudge():
+        nonlocal nudge_task
+        if nudge_task is not None:
+            nudge_task.cancel()
+            await asyncio.gather(nudge_task, return_exceptions=True)
+            nudge_task = None
+    
+    # 첫 인사 뒤에 사용자가 망설이는 경우도 Tom이 도와줌
+    arm_nudge()
+    try:
+        with websocket_connections.track_inprogress():
+            while True:
+                try:
+                    data = json.loads(await websocket.receive_text())
+                    if not isinstance(data, dict):
+                        raise ValueError("WebSocket message must be a JSON object")
+                except ValueError:
+                    await send({"type": "error", "message": "잘못된 메시지 형식입니다."})
+                    continue
+                
+                # 사용자가 무엇이든 보내면 망설이는 것이 아니므로 Tom 끼어들기 취소
+                await cancel_nudge()
+                if data.get("type") == "typing":
+                    if turn_task is None or turn_task.done():
+                        arm_nudge()
+                    continue
+                if data.get("type") not in ("message", "help") or (data["type"] == "message" and not (isinstance(data.get("message"), str) and data["message"])):
+                    continue
+                
+                if turn_task is not None and not turn_task.done():
+                    await send_rejected(admission_message(AdmissionRejected("session_busy", 1)), "session_busy", 1)
+                    continue
+                if data["type"] == "help":
+                    if two_person or not gemini_provider:
+                        await send_rejected("도움말은 Tom이 있는 3인 대화에서만 사용할 수 있습니다.")
+                    else:
+                        turn_task = asyncio.create_task(run_help())
+                    continue
+                
+                # 실제 사용자 메시지가 오면 미리 생성 중인 도움말은 더 이상 쓸모없음
+                speculative_nudges.cancel(session_id)
+                if isinstance(data.get("api_key"), str) and data["api_key"]:
+                    api_key = data["api_key"]
+                turn_task = asyncio.create_task(run_turn(data["message"], api_key))
+    except WebSocketDisconnect:
+        logger.info(f"WebSocket disconnected: {session_id}")
+    finally:
+        await cancel_nudge()
+        if turn_task is not None:
+            turn_task.cancel()
+            await asyncio.gather(turn_task, return_exceptions=True)
 
 # 서버 시작 시 로그
 logger.info("=== AI Chat Server initialized successfully ===")
@@ -538,4 +1196,8 @@ logger.info("  - POST /initial-greeting")
 logger.info("  - POST /initial-greeting-2person")
 logger.info("  - POST /chat")
 logger.info("  - POST /chat-2person")
+logger.info("  - POST /chat/stream")
+logger.info("  - POST /chat-2person/stream")
+logger.info("  - GET /metrics")
+logger.info("  - WS /ws")
 logger.info("  - GET /docs (FastAPI documentation)")
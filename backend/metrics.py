@@ -0,0 +1,257 @@
+import os
+import time
+import asyncio
+import bisect
+import logging
+import functools
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 이벤트 루프 지연 측정 주기 (초)
+LOOP_LAG_INTERVAL_SECONDS = float(os.getenv("LOOP_LAG_INTERVAL_SECONDS", "0.5"))
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192)
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(labelnames: Tuple[str, ...], labelvalues: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, labelvalues)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Metric:
+    """Prometheus 텍스트 포맷으로 내보내는 메트릭 (라벨별 값)"""
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def samples(self) -> Iterator[Tuple[str, str, float]]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for suffix, labels, value in self.samples():
+            lines.append(f"{self.name}{suffix}{labels} {_format_value(value)}")
+        return lines
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        for key, value in self._values.items():
+            yield "", _format_labels(self.labelnames, key), value
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = value
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def get(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    @contextmanager
+    def track_inprogress(self, **labels):
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+class CallbackMetric(Metric):
+    """내보낼 때마다 함수를 호출해서 값을 읽는 메트릭 (다른 모듈의 카운터 등)"""
+
+    def __init__(self, name: str, documentation: str, metric_type: str,
+                 func: Callable[[], Dict[Tuple[str, ...], float]], labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.type = metric_type
+        self.func = func
+
+    def samples(self):
+        try:
+            values = self.func()
+        except Exception as e:
+            logger.error(f"Metric callback failed for {self.name}: {e}")
+            return
+        for key, value in values.items():
+            yield "", _format_labels(self.labelnames, key), value
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[Tuple[str, ...], List] = {}  # key -> [버킷별 개수, 합계, 개수]
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        state = self._values.get(key)
+        if state is None:
+            state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            state[0][index] += 1
+        state[1] += value
+        state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def timed(self, **labels):
+        """동기 함수 실행 시간을 기록하는 데코레이터"""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.time(**labels):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def samples(self):
+        for key, (bucket_counts, total, count) in self._values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                cumulative += bucket_count
+                yield "_bucket", _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"'), cumulative
+            yield "_bucket", _format_labels(self.labelnames, key, 'le="+Inf"'), count
+            yield "_sum", _format_labels(self.labelnames, key), total
+            yield "_count", _format_labels(self.labelnames, key), count
+
+class Registry:
+    """등록된 메트릭을 모아 /metrics 응답으로 렌더링"""
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def callback(self, name: str, documentation: str, metric_type: str,
+                 func: Callable[[], Dict[Tuple[str, ...], float]], labelnames: Tuple[str, ...] = ()) -> CallbackMetric:
+        return self.register(CallbackMetric(name, documentation, metric_type, func, labelnames))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+# 전역 메트릭 레지스트리와 공통 메트릭
+registry = Registry()
+
+http_requests_in_flight = registry.gauge(
+    "http_requests_in_flight", "HTTP requests currently being handled")
+websocket_connections = registry.gauge(
+    "websocket_connections", "Open WebSocket conversation channels")
+http_request_seconds = registry.histogram(
+    "http_request_seconds", "HTTP request duration including streamed bodies", ("path", "method", "status"))
+stage_seconds = registry.histogram(
+    "chat_stage_seconds", "Time spent in each chat pipeline stage", ("stage",))
+speaker_seconds = registry.histogram(
+    "chat_speaker_seconds", "Time to produce each speaker's reply (including retries and fallback)", ("speaker", "outcome"))
+provider_request_seconds = registry.histogram(
+    "provider_request_seconds", "Upstream provider call duration", ("provider", "kind", "outcome"))
+provider_requests_in_flight = registry.gauge(
+    "provider_requests_in_flight", "Upstream provider calls in flight", ("provider",))
+provider_tokens = registry.counter(
+    "provider_tokens_total", "Tokens reported (or estimated for streams) by providers", ("provider", "type"))
+context_tokens = registry.histogram(
+    "chat_context_tokens", "Packed prompt size per persona", ("persona",), TOKEN_BUCKETS)
+event_loop_lag_seconds = registry.histogram(
+    "event_loop_lag_seconds", "Event loop scheduling delay", buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1))
+event_loop_lag_max_seconds = registry.gauge(
+    "event_loop_lag_max_seconds", "Largest event loop delay since the last scrape")
+
+def route_path(scope) -> str:
+    """라벨에 쓸 경로 (등록된 라우트 템플릿, 없으면 unmatched)"""
+    route = scope.get("route")
+    return getattr(route, "path", "unmatched")
+
+class MetricsMiddleware:
+    """요청 수와 처리 시간 (스트리밍 응답 본문 포함) 기록하는 ASGI 미들웨어"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            with http_requests_in_flight.track_inprogress():
+                await self.app(scope, receive, send_wrapper)
+        finally:
+            http_request_seconds.observe(
+                time.perf_counter() - started, path=route_path(scope), method=scope["method"], status=status["code"]
+            )
+
+async def monitor_loop_lag(interval: float = LOOP_LAG_INTERVAL_SECONDS):
+    """주기적으로 잠들었다 깨어난 시각의 지연으로 이벤트 루프 지연 측정"""
+    while True:
+        expected = time.perf_counter() + interval
+        await asyncio.sleep(interval)
+        lag = max(0.0, time.perf_counter() - expected)
+        event_loop_lag_seconds.observe(lag)
+        event_loop_lag_max_seconds.set(max(event_loop_lag_max_seconds.get(), lag))
+
+def render_metrics() -> str:
+    """메트릭 텍스트 렌더링 (최대 루프 지연은 스크레이프마다 초기화)"""
+    text = registry.render()
+    event_loop_lag_max_seconds.set(0.0)
+    return text
@@ -0,0 +1,139 @@
+import os
+import json
+import asyncio
+import time
+import hashlib
+import logging
+from typing import Dict, Optional
+from prompts import (
+    JINNY_CHAT_SYSTEM_PROMPT, TOM_SYSTEM_PROMPT, TWO_PERSON_SYSTEM_PROMPT,
+    INITIAL_GREETING_PROMPT, TWO_PERSON_GREETING_PROMPT,
+    JINNY_DEFAULT_GREETING_PROMPT, TWO_PERSON_DEFAULT_GREETING_PROMPT
+)
+from viewing_history import viewing_history_index
+
+logger = logging.getLogger(__name__)
+
+VIEWING_HISTORY_PATH = os.getenv("VIEWING_HISTORY_PATH", "data/viewing_history.json")
+# 시청기록 파일 변경 확인 주기 (초)
+VIEWING_HISTORY_CHECK_INTERVAL = float(os.getenv("VIEWING_HISTORY_CHECK_INTERVAL", "2"))
+
+# 페르소나별 시스템 프롬프트 템플릿
+PROMPT_TEMPLATES = {
+    "jinny": JINNY_CHAT_SYSTEM_PROMPT,
+    "tom": TOM_SYSTEM_PROMPT,
+    "2person": TWO_PERSON_SYSTEM_PROMPT,
+    "greeting": INITIAL_GREETING_PROMPT,
+    "greeting_2person": TWO_PERSON_GREETING_PROMPT,
+}
+
+# 시청기록이 없을 때 사용하는 프롬프트 (템플릿 대신)
+FALLBACK_PROMPTS = {
+    "greeting": JINNY_DEFAULT_GREETING_PROMPT,
+    "greeting_2person": TWO_PERSON_DEFAULT_GREETING_PROMPT,
+}
+
+def load_viewing_history(path: str = VIEWING_HISTORY_PATH) -> Optional[Dict]:
+    """시청기록 요약 로드 (원본 전체 대신 인덱스에서 관심사, 카테고리, 최근 영상만)"""
+    try:
+        data = viewing_history_index.load(path)
+        logger.info("Viewing history loaded successfully")
+        return data
+    except Exception as e:
+        logger.error(f"Error loading viewing history: {e}")
+        return None
+
+def render_viewing_history_info(viewing_history_data: Optional[Dict]) -> str:
+    """프롬프트에 넣을 시청기록 정보 문자열"""
+    if viewing_history_data:
+        top_interests = viewing_history_data.get('top_interests', [])
+        favorite_category = viewing_history_data.get('favorite_category', '')
+        recent_videos = viewing_history_data.get('viewing_history', [])[:3]
+
+        return f"""
+- 주요 관심사: {', '.join(top_interests)}
+- 가장 좋아하는 카테고리: {favorite_category}
+- 최근 시청 영상: {', '.join([video['title'] for video in recent_videos])}
+            """
+    return "시청기록 정보가 없습니다."
+
+class PromptCache:
+    """
+    시청기록 버전 + 페르소나별로 렌더링된 시스템 프롬프트 캐시
+
+    시청기록 파일이 바뀌면 인덱스 재생성 (큰 내보내기는 수백 ms)을 이벤트 루프 밖에서 하고,
+    끝날 때까지는 이전 프롬프트와 fingerprint를 계속 사용하다가 한 번에 교체합니다.
+    """
+
+    def __init__(self, path: str = VIEWING_HISTORY_PATH, check_interval: float = VIEWING_HISTORY_CHECK_INTERVAL):
+        self.path = path
+        self.check_interval = check_interval
+        self.version = 0  # 시청기록이 바뀔 때마다 증가
+        self.fingerprint = ""  # 시청기록 내용 해시
+        self.viewing_history_data: Optional[Dict] = None
+        self.viewing_history_info = render_viewing_history_info(None)
+        self._file_stamp = None
+        self._last_check = 0.0
+        self._reload: Optional[asyncio.Future] = None
+        self._prompts: Dict[str, str] = {}
+        self.refresh(force=True)
+
+    def refresh(self, force: bool = False):
+        """시청기록 파일이 바뀌었으면 다시 로드하고 캐시 무효화 (force가 아니면 백그라운드 스레드에서)"""
+        now = time.monotonic()
+        if not force and (now - self._last_check < self.check_interval or self._reload is not None):
+            return
+        self._last_check = now
+
+        try:
+            stat = os.stat(self.path)
+            file_stamp = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            file_stamp = None
+
+        if not force and file_stamp == self._file_stamp:
+            return
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        if force or loop is None:
+            self._apply(file_stamp, load_viewing_history(self.path))
+            return
+
+        self._reload = loop.run_in_executor(None, load_viewing_history, self.path)
+        self._reload.add_done_callback(lambda future: self._finish_reload(file_stamp, future))
+
+    def _finish_reload(self, file_stamp, future: asyncio.Future):
+        self._reload = None
+        if future.cancelled():
+            return
+        self._apply(file_stamp, future.result())
+
+    def _apply(self, file_stamp, viewing_history_data: Optional[Dict]):
+        """새 시청기록으로 교체 (이벤트 루프 스레드에서 한 번에 실행되므로 요청 중간에 섞이지 않음)"""
+        self._file_stamp = file_stamp
+        self.viewing_history_data = viewing_history_data
+        self.viewing_history_info = render_viewing_history_info(viewing_history_data)
+        self.fingerprint = hashlib.sha1(
+            json.dumps(viewing_history_data, sort_keys=True, ensure_ascii=False).encode('utf-8')
+        ).hexdigest()[:16]
+        self.version += 1
+        self._prompts.clear()
+        logger.info(f"Prompt cache invalidated (viewing history version {self.version})")
+
+    def get(self, persona: str) -> str:
+        """페르소나의 시스템 프롬프트 반환 (캐시에 없으면 렌더링)"""
+        self.refresh()
+        prompt = self._prompts.get(persona)
+        if prompt is None:
+            if not self.viewing_history_data and persona in FALLBACK_PROMPTS:
+                prompt = FALLBACK_PROMPTS[persona]
+            else:
+                prompt = PROMPT_TEMPLATES[persona].format(viewing_history_info=self.viewing_history_info)
+            self._prompts[persona] = prompt
+        return prompt
+
+# 전역 프롬프트 캐시 인스턴스
+prompt_cache = PromptCache()
@@ -0,0 +1,103 @@
+import asyncio
+import os
+import time
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional
+from client_pool import OpenAIClientPool, openai_client_pool
+from context_builder import count_tokens
+from metrics import provider_request_seconds, provider_requests_in_flight, provider_tokens
+
+logger = logging.getLogger(__name__)
+
+# 프로바이더별 동시 호출 한도
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "64"))
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "64"))
+
+@asynccontextmanager
+async def track_request(provider: str, kind: str):
+    """업스트림 호출 시간/동시 호출 수 기록"""
+    started = time.perf_counter()
+    outcome = "error"
+    provider_requests_in_flight.inc(provider=provider)
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        provider_requests_in_flight.dec(provider=provider)
+        provider_request_seconds.observe(time.perf_counter() - started, provider=provider, kind=kind, outcome=outcome)
+
+class OpenAIProvider:
+    """OpenAI 비동기 클라이언트 래퍼 (이벤트 루프를 막지 않음)"""
+
+    def __init__(self, model: str = "gpt-3.5-turbo", max_concurrency: int = OPENAI_MAX_CONCURRENCY,
+                 client_pool: OpenAIClientPool = openai_client_pool):
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.client_pool = client_pool
+
+    async def chat(self, api_key: str, messages: List[Dict], **params) -> str:
+        """채팅 완성 요청 후 응답 텍스트 반환"""
+        async with self.semaphore, track_request("openai", "chat"):
+            client = self.client_pool.get(api_key)
+            response = await client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                **params
+            )
+            if response.usage:
+                provider_tokens.inc(response.usage.prompt_tokens, provider="openai", type="prompt")
+                provider_tokens.inc(response.usage.completion_tokens, provider="openai", type="completion")
+            return response.choices[0].message.content
+
+    async def stream_chat(self, api_key: str, messages: List[Dict], **params) -> AsyncIterator[str]:
+        """채팅 완성을 스트리밍으로 요청하고 토큰 조각을 순서대로 반환"""
+        async with self.semaphore, track_request("openai", "stream"):
+            client = self.client_pool.get(api_key)
+            stream = await client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                stream=True,
+                **params
+            )
+            # 스트리밍 응답에는 사용량이 없으므로 토큰 수 추정
+            chunks = []
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    chunks.append(chunk.choices[0].delta.content)
+                    yield chunk.choices[0].delta.content
+            provider_tokens.inc(sum(count_tokens(msg["content"], "openai") for msg in messages), provider="openai", type="prompt")
+            provider_tokens.inc(count_tokens("".join(chunks), "openai"), provider="openai", type="completion")
+
+class GeminiProvider:
+    """Gemini 비동기 호출 래퍼"""
+
+    def __init__(self, model, max_concurrency: int = GEMINI_MAX_CONCURRENCY):
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def generate(self, prompt: str, max_output_tokens: Optional[int] = None) -> str:
+        """프롬프트로 콘텐츠 생성 후 응답 텍스트 반환 (max_output_tokens로 응답 길이 제한)"""
+        generation_config = {"max_output_tokens": max_output_tokens} if max_output_tokens else None
+        async with self.semaphore, track_request("gemini", "generate"):
+            response = await self.model.generate_content_async(prompt, generation_config=generation_config)
+            usage = getattr(response, "usage_metadata", None)
+            if usage:
+                provider_tokens.inc(usage.prompt_token_count, provider="gemini", type="prompt")
+                provider_tokens.inc(usage.candidates_token_count, provider="gemini", type="completion")
+            return response.text
+
+    async def stream_generate(self, prompt: str) -> AsyncIterator[str]:
+        """콘텐츠를 스트리밍으로 생성하고 텍스트 조각을 순서대로 반환"""
+        async with self.semaphore, track_request("gemini", "stream"):
+            response = await self.model.generate_content_async(prompt, stream=True)
+            async for chunk in response:
+                if chunk.text:
+                    yield chunk.text
+            # 스트림이 끝나면 마지막 청크 기준 사용량 기록
+            usage = getattr(response, "usage_metadata", None)
+            if usage:
+                provider_tokens.inc(usage.prompt_token_count, provider="gemini", type="prompt")
+                provider_tokens.inc(usage.candidates_token_count, provider="gemini", type="completion")
@@ -0,0 +1,209 @@
+import os
+import time
+import random
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Awaitable, Callable, List, Tuple
+import openai
+
+logger = logging.getLogger(__name__)
+
+# 재시도 / 서킷 브레이커 설정
+PROVIDER_MAX_RETRIES = int(os.getenv("PROVIDER_MAX_RETRIES", "2"))
+PROVIDER_RETRY_BASE_DELAY = float(os.getenv("PROVIDER_RETRY_BASE_DELAY", "0.5"))
+PROVIDER_RETRY_MAX_DELAY = float(os.getenv("PROVIDER_RETRY_MAX_DELAY", "4"))
+PROVIDER_ATTEMPT_TIMEOUT_SECONDS = float(os.getenv("PROVIDER_ATTEMPT_TIMEOUT_SECONDS", "15"))
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_SECONDS = float(os.getenv("CIRCUIT_RESET_SECONDS", "30"))
+# 대체 프로바이더가 있을 때 첫 프로바이더가 쓸 수 있는 마감 시간 비율
+FALLBACK_PRIMARY_SHARE = float(os.getenv("FALLBACK_PRIMARY_SHARE", "0.6"))
+
+# 다시 시도하면 성공할 수 있는 에러 (속도 제한, 타임아웃, 연결/서버 오류)
+RETRYABLE_ERRORS: Tuple[type, ...] = (
+    asyncio.TimeoutError,
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+)
+try:
+    from google.api_core import exceptions as google_exceptions
+    RETRYABLE_ERRORS += (
+        google_exceptions.ResourceExhausted,
+        google_exceptions.ServiceUnavailable,
+        google_exceptions.DeadlineExceeded,
+        google_exceptions.InternalServerError,
+    )
+except ImportError:
+    pass
+
+def is_retryable(error: BaseException) -> bool:
+    return isinstance(error, RETRYABLE_ERRORS)
+
+def should_fall_back(error: BaseException) -> bool:
+    """다른 프로바이더로 넘어갈 실패인지 (키/권한/요청 오류는 대체 프로바이더로 가리지 않고 그대로 전달)"""
+    return is_retryable(error) or isinstance(error, CircuitOpenError)
+
+class CircuitOpenError(Exception):
+    """서킷이 열려 있어 호출하지 않고 바로 실패"""
+
+    def __init__(self, provider: str):
+        super().__init__(f"{provider} circuit is open")
+        self.provider = provider
+
+class CircuitBreaker:
+    """연속 실패가 쌓이면 일정 시간 호출을 차단하고, 이후 한 번만 시험 호출 (closed -> open -> half_open)"""
+
+    def __init__(self, name: str, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+                 reset_timeout: float = CIRCUIT_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+
+    def allow(self) -> bool:
+        """호출 허용 여부 (half_open이면 시험 호출 하나만 허용)"""
+        if self.state == "closed":
+            return True
+        if self.state == "open":
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self.state = "half_open"
+            self._probing = False
+        if self._probing:
+            return False
+        self._probing = True
+        return True
+
+    def record_success(self):
+        if self.state != "closed":
+            logger.info(f"Circuit closed: {self.name}")
+        self.state = "closed"
+        self.failures = 0
+        self._probing = False
+
+    def record_failure(self):
+        self._probing = False
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                logger.warning(f"Circuit opened: {self.name} ({self.failures} consecutive failures)")
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def release(self):
+        """프로바이더 상태와 무관한 실패 (잘못된 요청 등) 후 시험 호출 권한만 반납"""
+        self._probing = False
+
+class ProviderGuard:
+    """프로바이더 호출 보호 (시도별 타임아웃, 지터 백오프 재시도, 서킷 브레이커)"""
+
+    def __init__(self, name: str, max_retries: int = PROVIDER_MAX_RETRIES,
+                 base_delay: float = PROVIDER_RETRY_BASE_DELAY, max_delay: float = PROVIDER_RETRY_MAX_DELAY,
+                 attempt_timeout: float = PROVIDER_ATTEMPT_TIMEOUT_SECONDS):
+        self.name = name
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.attempt_timeout = attempt_timeout
+        self.breaker = CircuitBreaker(name)
+
+    async def call(self, factory: Callable[[], Awaitable[Any]], timeout: float) -> Any:
+        """마감 시간(timeout) 안에서 재시도하며 호출"""
+        deadline = time.monotonic() + timeout
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                raise CircuitOpenError(self.name)
+
+            remaining = deadline - time.monotonic()
+            try:
+                result = await asyncio.wait_for(factory(), timeout=min(remaining, self.attempt_timeout))
+            except Exception as e:
+                if not is_retryable(e):
+                    self.breaker.release()
+                    raise
+                self.breaker.record_failure()
+
+                # full jitter 백오프, 재시도 횟수나 마감 시간을 넘기면 포기
+                attempt += 1
+                delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+                if attempt > self.max_retries or time.monotonic() + delay >= deadline:
+                    raise
+                logger.warning(f"{self.name} call failed ({type(e).__name__}), retry {attempt}/{self.max_retries} in {delay:.2f}s")
+                await asyncio.sleep(delay)
+                continue
+
+            self.breaker.record_success()
+            return result
+
+    async def stream(self, factory: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+        """스트리밍 호출 (재시도 없이 서킷 브레이커만 적용)"""
+        if not self.breaker.allow():
+            raise CircuitOpenError(self.name)
+
+        succeeded = failed = False
+        try:
+            async for chunk in factory():
+                yield chunk
+            succeeded = True
+        except Exception as e:
+            if is_retryable(e):
+                self.breaker.record_failure()
+                failed = True
+            raise
+        finally:
+            if succeeded:
+                self.breaker.record_success()
+            elif not failed:
+                self.breaker.release()
+
+async def call_with_fallback(name: str, attempts: List[Tuple[ProviderGuard, Callable[[], Awaitable[Any]]]],
+                             timeout: float) -> Any:
+    """
+    프로바이더를 순서대로 시도 (일시적인 장애로 실패하거나 서킷이 열려 있으면 다음 프로바이더)
+
+    전체 마감 시간을 공유하며, 뒤에 대체 프로바이더가 있으면 앞 프로바이더는 남은 시간의 일부만 사용합니다.
+    """
+    deadline = time.monotonic() + timeout
+    last_error: BaseException = asyncio.TimeoutError()
+    for index, (guard, factory) in enumerate(attempts):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        if index < len(attempts) - 1:
+            remaining *= FALLBACK_PRIMARY_SHARE
+        try:
+            return await guard.call(factory, remaining)
+        except Exception as e:
+            if not should_fall_back(e):
+                raise
+            last_error = e
+            if index < len(attempts) - 1:
+                logger.warning(f"{name} via {guard.name} failed ({type(e).__name__}: {e}), falling back")
+    raise last_error
+
+async def stream_with_fallback(name: str, attempts: List[Tuple[ProviderGuard, Callable[[], AsyncIterator[str]]]]) -> AsyncIterator[str]:
+    """스트리밍 프로바이더를 순서대로 시도 (첫 조각을 받기 전에 일시적인 장애로 실패한 경우에만 다음 프로바이더)"""
+    last_error: BaseException = CircuitOpenError(name)
+    for index, (guard, factory) in enumerate(attempts):
+        started = False
+        try:
+            async for chunk in guard.stream(factory):
+                started = True
+                yield chunk
+            return
+        except Exception as e:
+            if started or not should_fall_back(e):
+                raise
+            last_error = e
+            if index < len(attempts) - 1:
+                logger.warning(f"{name} stream via {guard.name} failed ({type(e).__name__}: {e}), falling back")
+    raise last_error
+
+# 프로바이더별 전역 보호 인스턴스
+openai_guard = ProviderGuard("openai")
+gemini_guard = ProviderGuard("gemini")
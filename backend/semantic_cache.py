@@ -0,0 +1,215 @@
+import os
+import re
+import math
+import time
+import zlib
+import logging
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 시맨틱 응답 캐시 설정 (기본은 꺼짐 - 대화 맥락과 무관하게 같은 답을 돌려주므로 명시적으로 켜야 함)
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() in ("1", "true", "yes")
+# 이 값 이상으로 비슷한 (코사인 유사도) 질문이면 캐시된 응답 사용
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.9"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "5000"))
+SEMANTIC_CACHE_TTL_SECONDS = float(os.getenv("SEMANTIC_CACHE_TTL_SECONDS", "86400"))
+# 이보다 긴 메시지는 맥락 의존적인 경우가 많으므로 캐시하지 않음
+SEMANTIC_CACHE_MAX_MESSAGE_CHARS = int(os.getenv("SEMANTIC_CACHE_MAX_MESSAGE_CHARS", "200"))
+# n-gram 해싱 차원 수
+SEMANTIC_CACHE_DIMENSIONS = int(os.getenv("SEMANTIC_CACHE_DIMENSIONS", str(1 << 20)))
+
+_PUNCTUATION = re.compile(r"[^\w\s]+")
+_WHITESPACE = re.compile(r"\s+")
+
+Vector = Dict[int, float]
+
+def normalize(text: str) -> str:
+    """비교용 정규화 (유니코드 NFKC, 소문자, 문장부호 제거, 공백 정리)"""
+    text = unicodedata.normalize("NFKC", text).lower()
+    text = _PUNCTUATION.sub(" ", text)
+    return _WHITESPACE.sub(" ", text).strip()
+
+def embed(normalized: str, dimensions: int = SEMANTIC_CACHE_DIMENSIONS) -> Vector:
+    """
+    단어 + 문자 3-gram을 해싱한 희소 벡터 (L2 정규화)
+
+    외부 모델 없이 CPU에서 바로 계산되며, 한국어처럼 띄어쓰기나 조사가 조금 달라도 문자 n-gram이 겹치면 가깝게 나옵니다.
+    단어는 가중치를 더 줘서 핵심 단어 하나만 다른 질문 ("apple" / "apply")이 같은 질문으로 잡히지 않게 합니다.
+    """
+    features = [(f"w:{word}", 2.0) for word in normalized.split(" ") if word]
+    padded = f" {normalized} "
+    features.extend((f"c:{padded[i:i + 3]}", 1.0) for i in range(len(padded) - 2))
+
+    vector: Vector = {}
+    for feature, weight in features:
+        index = zlib.crc32(feature.encode("utf-8")) % dimensions
+        vector[index] = vector.get(index, 0.0) + weight
+    norm = math.sqrt(sum(value * value for value in vector.values()))
+    if norm:
+        for index in vector:
+            vector[index] /= norm
+    return vector
+
+class CacheEntry:
+    __slots__ = ("entry_id", "scope", "normalized", "vector", "reply", "created_at")
+
+    def __init__(self, entry_id: int, scope: Tuple[str, str], normalized: str, vector: Vector, reply: str):
+        self.entry_id = entry_id
+        self.scope = scope
+        self.normalized = normalized
+        self.vector = vector
+        self.reply = reply
+        self.created_at = time.monotonic()
+
+class ScopeIndex:
+    """한 범위 (페르소나 + 시청기록 fingerprint)의 벡터 인덱스 (차원별 역색인으로 후보만 비교)"""
+
+    def __init__(self):
+        self.entries: Dict[int, CacheEntry] = {}
+        self.exact: Dict[str, int] = {}
+        self.postings: Dict[int, Set[int]] = {}
+
+    def add(self, entry: CacheEntry):
+        self.entries[entry.entry_id] = entry
+        self.exact[entry.normalized] = entry.entry_id
+        for index in entry.vector:
+            self.postings.setdefault(index, set()).add(entry.entry_id)
+
+    def remove(self, entry: CacheEntry):
+        self.entries.pop(entry.entry_id, None)
+        if self.exact.get(entry.normalized) == entry.entry_id:
+            del self.exact[entry.normalized]
+        for index in entry.vector:
+            ids = self.postings.get(index)
+            if ids is not None:
+                ids.discard(entry.entry_id)
+                if not ids:
+                    del self.postings[index]
+
+    def search(self, normalized: str, vector: Vector, threshold: float) -> Tuple[Optional[CacheEntry], float]:
+        """
+        threshold 이상으로 가장 비슷한 항목과 코사인 유사도
+
+        흔한 n-gram의 역색인은 매우 길어지므로 드문 차원부터 후보를 모읍니다. 아직 보지 않은 차원들의 노름이
+        threshold보다 작아지면 거기서만 겹치는 항목은 (코시-슈바르츠 부등식으로) threshold를 넘을 수 없으므로 멈춥니다.
+        """
+        entry_id = self.exact.get(normalized)
+        if entry_id is not None:
+            return self.entries[entry_id], 1.0
+
+        candidates: Set[int] = set()
+        remaining = 1.0  # 아직 보지 않은 차원들의 제곱합
+        for index in sorted(vector, key=lambda index: len(self.postings.get(index, ()))):
+            if remaining < threshold * threshold:
+                break
+            candidates.update(self.postings.get(index, ()))
+            remaining -= vector[index] * vector[index]
+
+        best, best_score = None, 0.0
+        for candidate in candidates:
+            entry = self.entries[candidate]
+            score = sum(weight * entry.vector.get(index, 0.0) for index, weight in vector.items())
+            if score > best_score:
+                best, best_score = entry, score
+        return best, best_score
+
+class SemanticCache:
+    """사용자 메시지가 이전 질문과 거의 같으면 캐시된 AI 응답을 재사용 (크기 LRU + 나이 기준 만료)"""
+
+    def __init__(self, enabled: bool = SEMANTIC_CACHE_ENABLED, threshold: float = SEMANTIC_CACHE_THRESHOLD,
+                 max_entries: int = SEMANTIC_CACHE_MAX_ENTRIES, ttl: float = SEMANTIC_CACHE_TTL_SECONDS,
+                 max_message_chars: int = SEMANTIC_CACHE_MAX_MESSAGE_CHARS):
+        self.enabled = enabled
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_message_chars = max_message_chars
+        self._scopes: Dict[Tuple[str, str], ScopeIndex] = {}
+        self._lru: "OrderedDict[int, CacheEntry]" = OrderedDict()
+        self._next_id = 0
+        self._last_sweep = time.monotonic()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._lru)
+
+    def _cacheable(self, message: str) -> bool:
+        return self.enabled and bool(message) and len(message) <= self.max_message_chars
+
+    def _scope(self, persona: str, fingerprint: str) -> ScopeIndex:
+        """현재 범위 인덱스 (같은 페르소나의 이전 시청기록 버전 항목은 정리)"""
+        for key in [key for key in self._scopes if key[0] == persona and key[1] != fingerprint]:
+            for entry in list(self._scopes[key].entries.values()):
+                self._remove(entry)
+            self._scopes.pop(key, None)
+        scope = self._scopes.get((persona, fingerprint))
+        if scope is None:
+            scope = self._scopes[(persona, fingerprint)] = ScopeIndex()
+        return scope
+
+    def _remove(self, entry: CacheEntry):
+        self._lru.pop(entry.entry_id, None)
+        scope = self._scopes.get(entry.scope)
+        if scope is not None:
+            scope.remove(entry)
+
+    def _expired(self, entry: CacheEntry, now: float) -> bool:
+        return now - entry.created_at >= self.ttl
+
+    def get(self, persona: str, fingerprint: str, message: str) -> Optional[str]:
+        """비슷한 질문에 대한 캐시된 응답 (없거나 꺼져 있으면 None)"""
+        if not self._cacheable(message):
+            return None
+        normalized = normalize(message)
+        if not normalized:
+            return None
+
+        entry, similarity = self._scope(persona, fingerprint).search(normalized, embed(normalized), self.threshold)
+        if entry is not None and self._expired(entry, time.monotonic()):
+            self._remove(entry)
+            entry = None
+        if entry is None or similarity < self.threshold:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._lru.move_to_end(entry.entry_id)
+        logger.info(f"Semantic cache hit for {persona} (similarity {similarity:.3f})")
+        return entry.reply
+
+    def put(self, persona: str, fingerprint: str, message: str, reply: str):
+        """새 응답 저장 (같은 정규화 문장이 있으면 교체)"""
+        if not self._cacheable(message) or not reply:
+            return
+        normalized = normalize(message)
+        if not normalized:
+            return
+
+        scope = self._scope(persona, fingerprint)
+        previous = scope.exact.get(normalized)
+        if previous is not None:
+            self._remove(scope.entries[previous])
+
+        self._next_id += 1
+        entry = CacheEntry(self._next_id, (persona, fingerprint), normalized, embed(normalized), reply)
+        scope.add(entry)
+        self._lru[entry.entry_id] = entry
+        self._evict()
+
+    def _evict(self):
+        """오래된 항목 만료 (전체 검사는 가끔만) 후 최대 개수를 넘으면 가장 오래 안 쓴 항목부터 제거"""
+        now = time.monotonic()
+        if now - self._last_sweep >= min(self.ttl, 60):
+            self._last_sweep = now
+            for entry in [entry for entry in self._lru.values() if self._expired(entry, now)]:
+                self._remove(entry)
+        while len(self._lru) > self.max_entries:
+            _, entry = self._lru.popitem(last=False)
+            self._remove(entry)
+
+# 전역 시맨틱 캐시 인스턴스
+semantic_cache = SemanticCache()
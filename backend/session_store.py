@@ -0,0 +1,361 @@
+import os
+import time
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Dict, List, Optional
+from conversation_logic import ConversationLogic
+from memory_system import ConversationMemory
+from keyword_compression import KeywordCompressor
+from storage import ConversationStorage, create_storage
+from state_backend import StateBackend, VersionConflict, create_state_backend
+
+logger = logging.getLogger(__name__)
+
+# 세션 저장소 설정
+SESSION_MAX_COUNT = int(os.getenv("SESSION_MAX_COUNT", "1000"))
+SESSION_IDLE_TTL_SECONDS = float(os.getenv("SESSION_IDLE_TTL_SECONDS", "1800"))
+SESSION_MAX_HISTORY_CHARS = int(os.getenv("SESSION_MAX_HISTORY_CHARS", "200000"))
+# 공유 상태 스냅샷에 넣을 최근 메시지 수 / 버전 충돌 시 다시 시도할 횟수
+SESSION_STATE_MAX_MESSAGES = int(os.getenv("SESSION_STATE_MAX_MESSAGES", "50"))
+SESSION_STATE_MAX_REBASES = int(os.getenv("SESSION_STATE_MAX_REBASES", "3"))
+
+DEFAULT_SESSION_ID = "default"
+
+class ConversationSession:
+    """세션별 대화 상태 (히스토리, 대화 로직, 메모리)"""
+
+    def __init__(self, session_id: str, max_history_chars: int = SESSION_MAX_HISTORY_CHARS,
+                 storage: Optional[ConversationStorage] = None):
+        self.session_id = session_id
+        self.max_history_chars = max_history_chars
+        self.storage = storage  # 영구 저장소 (없으면 메모리에만 유지)
+        self.full_conversation: List[Dict] = []
+        self.logic = ConversationLogic()
+        self.memory = ConversationMemory()
+        self.compressor = KeywordCompressor()
+        self.history_chars = 0
+        self.next_seq = 0  # 세션 내 메시지 일련번호
+        self.summary = ""  # 백그라운드에서 생성된 이전 대화 요약
+        self.summary_seq = -1  # 요약에 반영된 마지막 메시지 seq
+        self.generation = 0  # 대화 초기화 횟수 (백그라운드 작업 무효화용)
+        self.turn_lock = asyncio.Lock()  # 세션당 한 번에 한 턴만 처리
+        self.save_lock = asyncio.Lock()  # 공유 상태 저장은 한 번에 하나씩
+        self.version = 0  # 이 객체가 반영하고 있는 공유 상태 버전
+        self.base_generation = 0  # 마지막으로 공유 상태와 맞췄을 때의 generation
+        self.pending_messages: List[Dict] = []  # 아직 저장하지 않은 메시지
+        self.last_access = time.monotonic()
+
+    def add_message(self, message: Dict):
+        """히스토리에 메시지 추가 (세션 메모리 한도 초과 시 오래된 메시지 제거)"""
+        message["seq"] = self.next_seq
+        self.next_seq += 1
+        self.full_conversation.append(message)
+        self.history_chars += len(message["content"])
+        self.pending_messages.append(message)
+
+        while self.history_chars > self.max_history_chars and len(self.full_conversation) > 1:
+            removed = self.full_conversation.pop(0)
+            self.history_chars -= len(removed["content"])
+
+    def replace_history(self, messages: List[Dict]):
+        """히스토리 전체 교체 (압축 등)"""
+        self.full_conversation = messages
+        self.history_chars = sum(len(msg["content"]) for msg in messages)
+
+    def messages_after(self, after_seq: int, limit: int) -> List[Dict]:
+        """seq가 after_seq보다 큰 메시지를 최대 limit개 반환 (seq가 증가 순서라 이진 탐색)"""
+        messages = self.full_conversation
+        low, high = 0, len(messages)
+        while low < high:
+            mid = (low + high) // 2
+            seq = messages[mid].get("seq")
+            if seq is not None and seq > after_seq:
+                high = mid
+            else:
+                low = mid + 1
+        return messages[low:low + limit]
+
+    def history_etag(self, query: str = "") -> str:
+        """히스토리 내용이 바뀔 때마다 달라지는 ETag (추가/압축/초기화), query는 정규화한 페이지 조건"""
+        first_seq = self.full_conversation[0].get("seq") if self.full_conversation else None
+        key = f"{self.session_id}:{self.generation}:{self.next_seq}:{len(self.full_conversation)}:{first_seq}:{query}"
+        return '"' + hashlib.sha1(key.encode("utf-8")).hexdigest()[:16] + '"'
+
+    def _reset(self):
+        self.full_conversation = []
+        self.history_chars = 0
+        self.logic = ConversationLogic()
+        self.memory = ConversationMemory()
+        self.compressor.reset()
+        self.summary = ""
+        self.summary_seq = -1
+        self.pending_messages = []
+
+    def clear(self):
+        """세션 대화 상태 초기화"""
+        self._reset()
+        self.generation += 1
+        if self.storage:
+            self.storage.delete_session(self.session_id)
+
+    def state(self) -> Dict:
+        """대화 로직 상태와 요약 (영구 저장소 / 공유 상태에 기록)"""
+        return {
+            "logic": self.logic.conversation_state,
+            "summary": self.summary,
+            "summary_seq": self.summary_seq,
+            "next_seq": self.next_seq,
+            "generation": self.generation,
+        }
+
+    def snapshot(self) -> Dict:
+        """다른 워커가 세션을 이어받을 수 있는 상태 (최근 메시지만 포함)"""
+        recent = self.full_conversation[-SESSION_STATE_MAX_MESSAGES:]
+        return {
+            "state": self.state(),
+            "messages": [message for message in recent if message.get("seq") is not None],
+        }
+
+    def persist_state(self, message_count: Optional[int] = None):
+        """저장하지 않은 메시지 (앞에서 message_count개, 기본은 전부)와 대화 상태를 저장소에 기록 예약"""
+        count = len(self.pending_messages) if message_count is None else message_count
+        messages, self.pending_messages = self.pending_messages[:count], self.pending_messages[count:]
+        if self.storage:
+            for message in messages:
+                self.storage.append_message(self.session_id, message)
+            self.storage.save_state(self.session_id, self.state())
+
+    def restore(self, data: Dict):
+        """저장소에서 읽은 상태와 최근 메시지로 세션 복원"""
+        state = data.get("state", {})
+        messages = data.get("messages", [])
+        self.logic.conversation_state.update(state.get("logic", {}))
+        self.summary = state.get("summary", "")
+        self.summary_seq = state.get("summary_seq", -1)
+        self.generation = state.get("generation", 0)
+        self.next_seq = max(state.get("next_seq", 0), messages[-1]["seq"] + 1 if messages else 0)
+        for message in messages:
+            self.full_conversation.append(message)
+            self.history_chars += len(message["content"])
+            self.memory.add_message(message["role"], message["content"], message.get("speaker"))
+
+    def sync(self, version: int, snapshot: Dict):
+        """다른 워커가 저장한 공유 상태로 교체"""
+        self._reset()
+        self.restore(snapshot)
+        self.version = version
+        self.base_generation = self.generation
+
+    def rebase(self, version: int, snapshot: Optional[Dict]):
+        """
+        저장하다 버전이 충돌했을 때 최신 공유 상태 위에 이 워커의 변경을 다시 적용
+
+        - 공유 상태가 만료되었거나 이 워커에서 대화를 초기화했으면 이 워커 상태가 우선 (최신 버전 위에 덮어씀)
+        - 다른 워커에서 대화를 초기화했으면 이전 대화에 속한 저장 전 메시지는 버림
+        - 그 외에는 저장 전 메시지를 최신 히스토리 뒤에 새 seq로 다시 추가하고, 요약은 더 최신인 쪽 사용
+        """
+        if snapshot is None or self.generation != self.base_generation:
+            if snapshot is not None:
+                self.generation = max(self.generation, snapshot.get("state", {}).get("generation", 0) + 1)
+            self.version = version
+            return
+
+        base_generation = self.base_generation
+        pending = self.pending_messages
+        summary, summary_seq = self.summary, self.summary_seq
+        self.sync(version, snapshot)
+        if self.generation != base_generation:
+            return
+        if summary_seq > self.summary_seq:
+            self.summary, self.summary_seq = summary, summary_seq
+        for message in pending:
+            message = {key: value for key, value in message.items() if key != "seq"}
+            self.add_message(message)
+            self.memory.add_message(message["role"], message["content"], message.get("speaker"))
+
+class SessionStore:
+    """
+    세션 ID별 대화 상태 저장소 (LRU + 유휴 TTL 제거)
+
+    backend가 있으면 턴이 끝날 때마다 세션 스냅샷을 버전과 함께 저장하고, 요청을 받을 때 버전이 바뀌었으면
+    (다른 워커가 처리한 턴이 있으면) 공유 상태로 다시 맞춥니다. 메모리의 세션 객체는 그 캐시 역할입니다.
+    """
+
+    def __init__(self, max_sessions: int = SESSION_MAX_COUNT, idle_ttl: float = SESSION_IDLE_TTL_SECONDS,
+                 max_history_chars: int = SESSION_MAX_HISTORY_CHARS, storage: Optional[ConversationStorage] = None,
+                 backend: Optional[StateBackend] = None):
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.max_history_chars = max_history_chars
+        self.storage = storage
+        self.backend = backend
+        self.conflicts = 0
+        self._sessions: "OrderedDict[str, ConversationSession]" = OrderedDict()
+
+    @property
+    def shares_state(self) -> bool:
+        """다른 워커와 세션 상태를 공유하는지 (메모리에 없거나 오래된 세션일 수 있음)"""
+        return self.backend is not None and self.backend.shared
+
+    def get(self, session_id: Optional[str] = None) -> ConversationSession:
+        """세션 조회 (없으면 생성)"""
+        session_id = session_id or DEFAULT_SESSION_ID
+        now = time.monotonic()
+        self.evict_expired(now)
+
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = ConversationSession(session_id, self.max_history_chars, self.storage)
+            self._sessions[session_id] = session
+            logger.info(f"Session created: {session_id} (active sessions: {len(self._sessions)})")
+            self._evict_overflow()
+        else:
+            self._sessions.move_to_end(session_id)
+
+        session.last_access = now
+        return session
+
+    async def load(self, session_id: Optional[str] = None) -> ConversationSession:
+        """세션 조회 (공유 상태가 더 최신이면 맞추고, 처음 보는 세션은 저장소에서 복원)"""
+        session_id = session_id or DEFAULT_SESSION_ID
+        if self.backend is not None:
+            session = await self._load_shared(session_id)
+            if session is not None:
+                return session
+        return await self._load_stored(session_id)
+
+    async def _load_shared(self, session_id: str) -> Optional[ConversationSession]:
+        """공유 상태로 세션 조회 (공유 상태에 없는 새 세션이면 None)"""
+        session = self._sessions.get(session_id)
+        # 이 워커에서 턴이 진행 중이면 그대로 사용 (입장 제어에서 session_busy로 거절됨)
+        if session is not None and session.turn_lock.locked():
+            return self.get(session_id)
+
+        try:
+            if session is not None and await self.backend.version(session_id) == session.version:
+                return self.get(session_id)
+            version, snapshot = await self.backend.load(session_id)
+        except Exception as e:
+            # 공유 저장소 장애 시에는 이 워커의 상태로 계속 진행
+            logger.error(f"Error loading session {session_id} from state backend: {type(e).__name__}: {e}")
+            return self.get(session_id) if session is not None else None
+
+        if snapshot is None:
+            return self.get(session_id) if session_id in self._sessions else None
+        session = self.get(session_id)
+        if session.version != version and not session.turn_lock.locked():
+            session.sync(version, snapshot)
+            logger.info(f"Session synced from state backend: {session_id} (version {version})")
+        return session
+
+    async def save(self, session: ConversationSession):
+        """
+        턴이 끝난 세션 저장 (공유 상태는 버전 비교 후 교체, 영구 저장소에는 확정된 메시지만 기록)
+
+        다른 워커가 먼저 저장해서 버전이 충돌하면 최신 상태 위에 이 턴의 변경을 다시 적용한 뒤 재시도합니다.
+        """
+        if self.backend is None:
+            session.persist_state()
+            return
+
+        async with session.save_lock:
+            for _ in range(SESSION_STATE_MAX_REBASES + 1):
+                message_count = len(session.pending_messages)
+                try:
+                    session.version = await self.backend.save(session.session_id, session.snapshot(), session.version)
+                except VersionConflict as e:
+                    self.conflicts += 1
+                    logger.warning(f"{e}, rebasing")
+                    try:
+                        version, snapshot = await self.backend.load(session.session_id)
+                    except Exception as load_error:
+                        logger.error(f"Error reloading session {session.session_id} after conflict: {load_error}")
+                        break
+                    session.rebase(version, snapshot)
+                    continue
+                except Exception as e:
+                    logger.error(f"Error saving session {session.session_id} to state backend: {type(e).__name__}: {e}")
+                    break
+                session.base_generation = session.generation
+                session.persist_state(message_count)
+                return
+
+        # 공유 상태에 저장하지 못했어도 이 워커에서 확정한 대화는 영구 저장소에 남김
+        logger.error(f"Session {session.session_id} could not be saved to state backend")
+        session.persist_state()
+
+    async def _load_stored(self, session_id: str) -> ConversationSession:
+        """세션 조회 (메모리에 없으면 영구 저장소에서 복원, 디스크 읽기는 스레드에서)"""
+        if self.storage is None or session_id in self._sessions:
+            return self.get(session_id)
+
+        try:
+            data = await asyncio.get_running_loop().run_in_executor(None, self.storage.load_session, session_id)
+        except Exception as e:
+            logger.error(f"Error loading session {session_id} from storage: {e}")
+            data = None
+
+        # 읽는 동안 다른 요청이 먼저 세션을 만들었으면 그대로 사용
+        restored = session_id not in self._sessions
+        session = self.get(session_id)
+        if restored and data:
+            session.restore(data)
+            logger.info(f"Session restored from storage: {session_id} ({len(session.full_conversation)} messages)")
+        return session
+
+    async def find(self, session_id: Optional[str] = None) -> Optional[ConversationSession]:
+        """
+        읽기 전용 세션 조회 (없는 세션이면 None)
+
+        메모리에 없는 세션은 저장소에서 읽기만 하고 세션 저장소에는 넣지 않으므로,
+        임의의 session_id로 조회해도 진행 중인 세션이 LRU에서 밀려나지 않습니다.
+        """
+        session_id = session_id or DEFAULT_SESSION_ID
+        if self.backend is not None:
+            session = await self._load_shared(session_id)
+            if session is not None:
+                return session
+        session = self.peek(session_id)
+        if session is not None or self.storage is None:
+            return session
+
+        try:
+            data = await asyncio.get_running_loop().run_in_executor(None, self.storage.load_session, session_id)
+        except Exception as e:
+            logger.error(f"Error loading session {session_id} from storage: {e}")
+            return None
+        if not data:
+            return None
+        session = ConversationSession(session_id, self.max_history_chars)
+        session.restore(data)
+        return session
+
+    def peek(self, session_id: Optional[str] = None) -> Optional[ConversationSession]:
+        """세션 조회 (생성하거나 LRU 순서를 바꾸지 않음)"""
+        return self._sessions.get(session_id or DEFAULT_SESSION_ID)
+
+    def evict_expired(self, now: Optional[float] = None):
+        """유휴 TTL이 지난 세션 제거 (가장 오래된 것부터 확인)"""
+        now = now if now is not None else time.monotonic()
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if now - session.last_access < self.idle_ttl:
+                break
+            self._sessions.popitem(last=False)
+            logger.info(f"Session expired: {session_id}")
+
+    def _evict_overflow(self):
+        """최대 세션 수 초과 시 가장 오래 사용하지 않은 세션 제거"""
+        while len(self._sessions) > self.max_sessions:
+            session_id, _ = self._sessions.popitem(last=False)
+            logger.info(f"Session evicted (LRU): {session_id}")
+
+    def __len__(self):
+        return len(self._sessions)
+
+# 전역 영구 저장소 / 공유 상태 저장소 / 세션 저장소 인스턴스
+conversation_storage = create_storage()
+session_state_backend = create_state_backend()
+session_store = SessionStore(storage=conversation_storage, backend=session_state_backend)
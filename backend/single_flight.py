@@ -0,0 +1,62 @@
+import json
+import asyncio
+import hashlib
+import logging
+from typing import Any, Awaitable, Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+def flight_key(*parts: Any) -> str:
+    """요청 구성 요소 (모델, 메시지, 파라미터 등)로 만든 단일 비행 키"""
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+class _Flight:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+class SingleFlight:
+    """같은 키의 요청이 동시에 진행 중이면 업스트림 호출 하나를 공유"""
+
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+        self.started = 0  # 실제 업스트림 호출 수
+        self.coalesced = 0  # 진행 중인 호출에 합류한 요청 수
+
+    async def do(self, key: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """진행 중인 같은 호출이 있으면 그 결과를 기다리고, 없으면 새로 시작"""
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(factory()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda task: self._finish(key, flight))
+            self.started += 1
+        else:
+            self.coalesced += 1
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            # 기다리는 요청이 모두 취소되면 업스트림 호출도 취소
+            if flight.waiters == 1 and not flight.task.done():
+                flight.task.cancel()
+            raise
+        finally:
+            flight.waiters -= 1
+
+    def _finish(self, key: str, flight: _Flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        # 기다리던 요청이 모두 취소된 뒤 실패한 경우 경고가 남지 않도록 예외 확인
+        if not flight.task.cancelled():
+            flight.task.exception()
+
+    def __len__(self):
+        return len(self._flights)
+
+# 전역 단일 비행 인스턴스 (프로바이더 호출 공유)
+single_flight = SingleFlight()
@@ -0,0 +1,127 @@
+import os
+import time
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+from admission import TokenBucket
+from context_builder import count_tokens
+
+logger = logging.getLogger(__name__)
+
+# Tom 도움말 미리 생성 설정 (기본은 꺼짐 - 쓰이지 않을 수도 있는 호출에 토큰을 씀)
+SPECULATIVE_NUDGES_ENABLED = os.getenv("SPECULATIVE_NUDGES_ENABLED", "false").lower() in ("1", "true", "yes")
+SPECULATIVE_NUDGE_TTL_SECONDS = float(os.getenv("SPECULATIVE_NUDGE_TTL_SECONDS", "120"))
+# 미리 생성 하나의 최대 응답 토큰 수
+SPECULATIVE_MAX_OUTPUT_TOKENS = int(os.getenv("SPECULATIVE_MAX_OUTPUT_TOKENS", "120"))
+# 전체 세션 합계 분당 토큰 예산 (프롬프트 + 최대 응답 토큰 기준으로 미리 차감)
+SPECULATIVE_TOKEN_BUDGET_PER_MINUTE = float(os.getenv("SPECULATIVE_TOKEN_BUDGET_PER_MINUTE", "20000"))
+
+PromptBuilder = Callable[[], str]
+Generate = Callable[[str], Awaitable[str]]
+
+class SpeculativeNudges:
+    """
+    어시스턴트 턴이 끝난 뒤 사용자가 고민하는 동안 Tom의 도움말 (망설임 nudge, 주제 어휘 힌트)을 미리 생성
+
+    세션별로 마지막 턴 기준 (generation, next_seq)으로 보관하고 한 번 쓰면 버립니다.
+    실제 사용자 메시지가 오면 진행 중인 생성을 취소하고, 예산이 부족하면 생성하지 않습니다.
+    """
+
+    def __init__(self, enabled: bool = SPECULATIVE_NUDGES_ENABLED, ttl: float = SPECULATIVE_NUDGE_TTL_SECONDS,
+                 max_output_tokens: int = SPECULATIVE_MAX_OUTPUT_TOKENS,
+                 budget_per_minute: float = SPECULATIVE_TOKEN_BUDGET_PER_MINUTE):
+        self.enabled = enabled
+        self.ttl = ttl
+        self.max_output_tokens = max_output_tokens
+        self.budget = TokenBucket(budget_per_minute / 60, budget_per_minute)
+        self._entries: Dict[str, Tuple[Tuple[int, int], float, Dict[str, str]]] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+        self.cancelled = 0
+        self.over_budget = 0
+        self.spent_tokens = 0
+
+    @staticmethod
+    def _turn_key(session) -> Tuple[int, int]:
+        return session.generation, session.next_seq
+
+    def schedule(self, session, builders: Dict[str, PromptBuilder], generate: Generate):
+        """종류별 프롬프트 (builders)로 백그라운드 생성 시작 (같은 세션의 이전 작업과 결과는 버림)"""
+        if not self.enabled:
+            return
+        self.cancel(session.session_id)
+        self._evict_expired()
+        self._tasks[session.session_id] = asyncio.create_task(self._run(session, builders, generate))
+
+    async def _run(self, session, builders: Dict[str, PromptBuilder], generate: Generate):
+        session_id = session.session_id
+        turn_key = self._turn_key(session)
+        results: Dict[str, str] = {}
+        try:
+            for kind, build in builders.items():
+                prompt = build()
+                cost = count_tokens(prompt, "gemini") + self.max_output_tokens
+                allowed, _ = self.budget.try_acquire(cost)
+                if not allowed:
+                    self.over_budget += 1
+                    logger.info(f"Speculative {kind} skipped for session {session_id} (token budget exhausted)")
+                    break
+                self.spent_tokens += cost
+                results[kind] = await generate(prompt)
+
+            # 생성하는 동안 대화가 진행되었으면 버림
+            if results and self._turn_key(session) == turn_key:
+                self._entries[session_id] = (turn_key, time.monotonic(), results)
+                logger.info(f"Speculative help ready for session {session_id}: {list(results)}")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Speculative generation failed for session {session_id}: {type(e).__name__}: {e}")
+        finally:
+            if self._tasks.get(session_id) is asyncio.current_task():
+                del self._tasks[session_id]
+
+    def take(self, session, kind: str) -> Optional[str]:
+        """미리 생성된 도움말 꺼내기 (마지막 턴 이후 대화가 바뀌었거나 만료되었으면 None)"""
+        entry = self._entries.get(session.session_id)
+        if entry is None:
+            self.misses += 1
+            return None
+        turn_key, created_at, results = entry
+        if turn_key != self._turn_key(session) or time.monotonic() - created_at >= self.ttl:
+            del self._entries[session.session_id]
+            self.misses += 1
+            return None
+        text = results.pop(kind, None)
+        if not results:
+            del self._entries[session.session_id]
+        if text is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return text
+
+    def cancel(self, session_id: str):
+        """실제 사용자 메시지가 왔을 때 진행 중인 생성 취소, 남은 결과 삭제"""
+        task = self._tasks.pop(session_id, None)
+        if task is not None and not task.done():
+            task.cancel()
+            self.cancelled += 1
+        self._entries.pop(session_id, None)
+
+    def _evict_expired(self):
+        now = time.monotonic()
+        for session_id in [session_id for session_id, (_, created_at, _) in self._entries.items()
+                           if now - created_at >= self.ttl]:
+            del self._entries[session_id]
+
+    async def shutdown(self):
+        """진행 중인 생성 작업 취소"""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+# 전역 미리 생성 인스턴스
+speculative_nudges = SpeculativeNudges()
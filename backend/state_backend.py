@@ -0,0 +1,145 @@
+import os
+import json
+import logging
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 세션 상태 공유 저장소 설정 (memory: 공유하지 않음, redis: 여러 워커/호스트가 공유, inprocess: 개발/테스트용)
+SESSION_STATE_BACKEND = os.getenv("SESSION_STATE_BACKEND", "memory").lower()
+SESSION_STATE_REDIS_URL = os.getenv("SESSION_STATE_REDIS_URL", "redis://localhost:6379/0")
+SESSION_STATE_KEY_PREFIX = os.getenv("SESSION_STATE_KEY_PREFIX", "ai-chat:session:")
+# 마지막 저장 이후 이 시간이 지나면 공유 저장소에서 만료 (영구 기록은 SQLite 저장소에 남음)
+SESSION_STATE_TTL_SECONDS = int(os.getenv("SESSION_STATE_TTL_SECONDS", "86400"))
+SESSION_STATE_TIMEOUT_SECONDS = float(os.getenv("SESSION_STATE_TIMEOUT_SECONDS", "2"))
+
+Snapshot = Dict
+
+class VersionConflict(Exception):
+    """다른 워커가 먼저 세션 상태를 저장해서 버전이 맞지 않음"""
+
+    def __init__(self, session_id: str, expected: int, actual: int):
+        super().__init__(f"Session {session_id} version conflict (expected {expected}, found {actual})")
+        self.session_id = session_id
+        self.expected = expected
+        self.actual = actual
+
+class StateBackend:
+    """
+    세션 상태 스냅샷 저장소 (세션별 버전으로 낙관적 동시성 제어)
+
+    저장할 때 마지막으로 읽은 버전을 함께 보내고, 그 사이에 다른 워커가 저장했으면 VersionConflict를 발생시킵니다.
+    버전 0은 아직 저장된 적이 없는 세션입니다.
+    """
+    shared = False  # 다른 프로세스와 상태를 공유하는지
+
+    async def version(self, session_id: str) -> int:
+        raise NotImplementedError
+
+    async def load(self, session_id: str) -> Tuple[int, Optional[Snapshot]]:
+        raise NotImplementedError
+
+    async def save(self, session_id: str, snapshot: Snapshot, expected_version: int) -> int:
+        """스냅샷 저장 후 새 버전 반환"""
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+class InMemoryStateBackend(StateBackend):
+    """
+    프로세스 내부 저장소 (SESSION_STATE_BACKEND=inprocess)
+
+    Redis 없이 스냅샷 직렬화와 버전 충돌/재적용 경로를 확인하기 위한 개발/테스트용입니다.
+    세션이 제거되어도 스냅샷이 정리되지 않으므로 서비스에는 쓰지 않습니다.
+    """
+
+    def __init__(self):
+        self._data: Dict[str, Tuple[int, str]] = {}
+
+    async def version(self, session_id: str) -> int:
+        return self._data.get(session_id, (0, None))[0]
+
+    async def load(self, session_id: str) -> Tuple[int, Optional[Snapshot]]:
+        version, payload = self._data.get(session_id, (0, None))
+        return version, json.loads(payload) if payload is not None else None
+
+    async def save(self, session_id: str, snapshot: Snapshot, expected_version: int) -> int:
+        current = self._data.get(session_id, (0, None))[0]
+        if current != expected_version:
+            raise VersionConflict(session_id, expected_version, current)
+        self._data[session_id] = (current + 1, json.dumps(snapshot, ensure_ascii=False))
+        return current + 1
+
+# 버전이 일치할 때만 스냅샷을 교체하는 compare-and-set (Redis 호환 서버에서 원자적으로 실행)
+REDIS_SAVE_SCRIPT = """
+local current = tonumber(redis.call('HGET', KEYS[1], 'version') or '0')
+if current ~= tonumber(ARGV[1]) then
+    return {0, current}
+end
+redis.call('HSET', KEYS[1], 'version', current + 1, 'state', ARGV[2])
+if tonumber(ARGV[3]) > 0 then
+    redis.call('EXPIRE', KEYS[1], ARGV[3])
+end
+return {1, current + 1}
+"""
+
+class RedisStateBackend(StateBackend):
+    """Redis 호환 서버 (Redis, Valkey, KeyDB 등) 저장소 - 세션당 해시 키 하나 (version, state)"""
+    shared = True
+
+    def __init__(self, url: str = SESSION_STATE_REDIS_URL, key_prefix: str = SESSION_STATE_KEY_PREFIX,
+                 ttl: int = SESSION_STATE_TTL_SECONDS, timeout: float = SESSION_STATE_TIMEOUT_SECONDS):
+        import redis.asyncio as redis_asyncio
+
+        self.key_prefix = key_prefix
+        self.ttl = ttl
+        self._client = redis_asyncio.from_url(
+            url, decode_responses=True, socket_timeout=timeout, socket_connect_timeout=timeout
+        )
+        self._save_script = self._client.register_script(REDIS_SAVE_SCRIPT)
+
+    def _key(self, session_id: str) -> str:
+        return f"{self.key_prefix}{session_id}"
+
+    async def version(self, session_id: str) -> int:
+        return int(await self._client.hget(self._key(session_id), "version") or 0)
+
+    async def load(self, session_id: str) -> Tuple[int, Optional[Snapshot]]:
+        version, payload = await self._client.hmget(self._key(session_id), ["version", "state"])
+        return int(version or 0), json.loads(payload) if payload is not None else None
+
+    async def save(self, session_id: str, snapshot: Snapshot, expected_version: int) -> int:
+        saved, version = await self._save_script(
+            keys=[self._key(session_id)],
+            args=[expected_version, json.dumps(snapshot, ensure_ascii=False), self.ttl]
+        )
+        if not saved:
+            raise VersionConflict(session_id, expected_version, int(version))
+        return int(version)
+
+    async def close(self):
+        await self._client.aclose()
+
+def create_state_backend() -> Optional[StateBackend]:
+    """
+    설정에 따라 세션 상태 공유 저장소 생성
+
+    memory (기본값)이거나 Redis를 쓸 수 없으면 None - 워커 하나일 때는 공유할 상태가 없으므로
+    턴마다 스냅샷을 직렬화하거나 세션 저장소 밖에 따로 보관하지 않습니다. inprocess는 개발/테스트용 InMemoryStateBackend.
+    """
+    if SESSION_STATE_BACKEND == "redis":
+        try:
+            backend = RedisStateBackend()
+            logger.info(f"Shared session state backend: redis ({SESSION_STATE_KEY_PREFIX}*)")
+            return backend
+        except ImportError:
+            logger.error("SESSION_STATE_BACKEND=redis requires the 'redis' package, falling back to in-process state")
+        except Exception as e:
+            logger.error(f"Error initializing redis session state backend: {e}")
+    elif SESSION_STATE_BACKEND == "inprocess":
+        logger.warning("Session state backend: inprocess (development only, snapshots are never evicted)")
+        return InMemoryStateBackend()
+    elif SESSION_STATE_BACKEND != "memory":
+        logger.warning(f"Unknown SESSION_STATE_BACKEND '{SESSION_STATE_BACKEND}', using in-process state")
+    return None
@@ -0,0 +1,193 @@
+import os
+import json
+import time
+import queue
+import sqlite3
+import logging
+import threading
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 영구 저장소 설정 (경로를 비우면 비활성화)
+CONVERSATION_DB_PATH = os.getenv("CONVERSATION_DB_PATH", "data/conversations.db")
+STORAGE_BATCH_SIZE = int(os.getenv("STORAGE_BATCH_SIZE", "200"))
+STORAGE_FLUSH_INTERVAL_SECONDS = float(os.getenv("STORAGE_FLUSH_INTERVAL_SECONDS", "0.5"))
+# 재시작 후 세션을 복원할 때 메모리로 다시 읽어 올 최근 메시지 수
+STORAGE_REHYDRATE_MESSAGES = int(os.getenv("STORAGE_REHYDRATE_MESSAGES", "30"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    session_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    speaker TEXT,
+    content TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (session_id, seq)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    state TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+class ConversationStorage:
+    """SQLite(WAL) 대화 저장소 - 요청 경로에서는 큐에 넣기만 하고 백그라운드 스레드가 배치 커밋"""
+
+    def __init__(self, path: str = CONVERSATION_DB_PATH, batch_size: int = STORAGE_BATCH_SIZE,
+                 flush_interval: float = STORAGE_FLUSH_INTERVAL_SECONDS):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: "queue.Queue" = queue.Queue()
+        self._writer: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._closed = False
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        connection = self._connect()
+        connection.executescript(SCHEMA)
+        connection.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, timeout=30)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def _ensure_writer(self):
+        if self._writer is None:
+            with self._lock:
+                if self._writer is None:
+                    self._writer = threading.Thread(target=self._run_writer, name="conversation-storage-writer", daemon=True)
+                    self._writer.start()
+
+    # --- 요청 경로에서 호출 (큐에 넣기만 함) ---
+
+    def append_message(self, session_id: str, message: Dict):
+        """메시지 추가 예약"""
+        self._put(("message", session_id, (
+            message["seq"], message["role"], message.get("speaker"), message["content"], time.time()
+        )))
+
+    def save_state(self, session_id: str, state: Dict):
+        """세션 상태 (대화 로직, 요약 등) 저장 예약"""
+        self._put(("state", session_id, json.dumps(state, ensure_ascii=False)))
+
+    def delete_session(self, session_id: str):
+        """세션 대화 삭제 예약"""
+        self._put(("delete", session_id, None))
+
+    def _put(self, operation):
+        if self._closed:
+            return
+        self._ensure_writer()
+        self._queue.put(operation)
+
+    # --- 백그라운드 쓰기 스레드 ---
+
+    def _run_writer(self):
+        connection = self._connect()
+        try:
+            while True:
+                try:
+                    operation = self._queue.get(timeout=self.flush_interval)
+                except queue.Empty:
+                    continue
+                if operation is None:
+                    break
+
+                # 큐에 쌓인 작업을 한 트랜잭션으로 묶어서 커밋
+                batch = [operation]
+                stop = False
+                while len(batch) < self.batch_size:
+                    try:
+                        operation = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if operation is None:
+                        stop = True
+                        break
+                    batch.append(operation)
+
+                self._write_batch(connection, batch)
+                if stop:
+                    break
+        finally:
+            connection.close()
+
+    def _write_batch(self, connection: sqlite3.Connection, batch: List):
+        try:
+            with connection:
+                for kind, session_id, payload in batch:
+                    if kind == "message":
+                        connection.execute(
+                            "INSERT OR REPLACE INTO messages (session_id, seq, role, speaker, content, created_at) "
+                            "VALUES (?, ?, ?, ?, ?, ?)",
+                            (session_id, *payload)
+                        )
+                    elif kind == "state":
+                        connection.execute(
+                            "INSERT OR REPLACE INTO sessions (session_id, state, updated_at) VALUES (?, ?, ?)",
+                            (session_id, payload, time.time())
+                        )
+                    elif kind == "delete":
+                        connection.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+                        connection.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+        except Exception as e:
+            logger.error(f"Conversation storage batch write failed ({len(batch)} ops): {type(e).__name__}: {e}")
+
+    # --- 읽기 (세션 복원) ---
+
+    def load_session(self, session_id: str, max_messages: int = STORAGE_REHYDRATE_MESSAGES) -> Optional[Dict]:
+        """세션 상태와 최근 메시지 로드 (없으면 None)"""
+        connection = self._connect()
+        try:
+            row = connection.execute(
+                "SELECT state FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            rows = connection.execute(
+                "SELECT seq, role, speaker, content FROM messages WHERE session_id = ? "
+                "ORDER BY seq DESC LIMIT ?",
+                (session_id, max_messages)
+            ).fetchall()
+        finally:
+            connection.close()
+
+        if row is None and not rows:
+            return None
+
+        messages = []
+        for seq, role, speaker, content in reversed(rows):
+            message = {"role": role, "content": content, "seq": seq}
+            if speaker is not None:
+                message["speaker"] = speaker
+            messages.append(message)
+        return {"state": json.loads(row[0]) if row else {}, "messages": messages}
+
+    def close(self):
+        """남은 작업을 기록하고 쓰기 스레드 종료"""
+        if self._closed:
+            return
+        self._closed = True
+        if self._writer is not None:
+            self._queue.put(None)
+            self._writer.join()
+
+def create_storage() -> Optional[ConversationStorage]:
+    """설정에 따라 저장소 생성 (비활성화되었거나 실패하면 None)"""
+    if not CONVERSATION_DB_PATH:
+        logger.info("Conversation storage disabled")
+        return None
+    try:
+        storage = ConversationStorage(CONVERSATION_DB_PATH)
+        logger.info(f"Conversation storage enabled: {CONVERSATION_DB_PATH}")
+        return storage
+    except Exception as e:
+        logger.error(f"Error initializing conversation storage: {e}")
+        return None
@@ -1,52 +1,77 @@
-import openai
-from typing import List, Dict
+from openai import OpenAI
+from typing import List, Dict, Optional
+
+SUMMARY_SYSTEM_PROMPT = "대화를 2-3문장으로 요약해주세요. 주요 주제와 핵심 내용만 포함하세요."
 
 class ConversationSummarizer:
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, provider=None):
         self.api_key = api_key
-        openai.api_key = api_key
-    
-    def summarize_conversation(self, messages: List[Dict]) -> str:
-        """대화 요약 생성"""
-        if len(messages) < 5:
-            return "대화가 시작되었습니다."
-        
+        # 비동기 요약에 사용할 OpenAIProvider (없으면 동기 클라이언트만 사용)
+        self.provider = provider
+        self._client: Optional[OpenAI] = None
+
+    @property
+    def client(self) -> OpenAI:
+        """전역 openai.api_key를 바꾸지 않고 인스턴스별 클라이언트 사용"""
+        if self._client is None:
+            self._client = OpenAI(api_key=self.api_key)
+        return self._client
+
+    def build_summary_request(self, messages: List[Dict], previous_summary: str = None) -> List[Dict]:
+        """요약 요청 메시지 구성 (이전 요약이 있으면 이어서 요약)"""
         # 대화 내용을 텍스트로 변환
         conversation_text = ""
+        if previous_summary:
+            conversation_text += f"이전 요약: {previous_summary}\n\n"
         for msg in messages:
             if msg["role"] == "user":
                 conversation_text += f"User: {msg['content']}\n"
             elif msg["role"] == "assistant":
                 speaker = msg.get("speaker", "AI")
                 conversation_text += f"{speaker}: {msg['content']}\n"
-        
+
+        return [
+            {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
+            {"role": "user", "content": f"다음 대화를 요약해주세요:\n\n{conversation_text}"}
+        ]
+
+    def summarize_conversation(self, messages: List[Dict]) -> str:
+        """대화 요약 생성"""
+        if len(messages) < 5:
+            return "대화가 시작되었습니다."
+
         try:
-            response = openai.chat.completions.create(
+            response = self.client.chat.completions.create(
                 model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": "대화를 2-3문장으로 요약해주세요. 주요 주제와 핵심 내용만 포함하세요."},
-                    {"role": "user", "content": f"다음 대화를 요약해주세요:\n\n{conversation_text}"}
-                ],
+                messages=self.build_summary_request(messages),
                 max_tokens=100
             )
             return response.choices[0].message.content
         except Exception as e:
             return f"대화 요약: {len(messages)}개의 메시지가 있었습니다."
-    
+
+    async def summarize_conversation_async(self, messages: List[Dict], previous_summary: str = None) -> str:
+        """대화 요약 생성 (비동기, 실패 시 예외를 그대로 전달)"""
+        return await self.provider.chat(
+            self.api_key,
+            self.build_summary_request(messages, previous_summary),
+            max_tokens=100
+        )
+
     def compress_old_messages(self, messages: List[Dict], keep_recent: int = 10) -> List[Dict]:
         """오래된 메시지 압축"""
         if len(messages) <= keep_recent:
             return messages
-        
+
         # 최근 메시지는 유지
         recent_messages = messages[-keep_recent:]
-        
+
         # 오래된 메시지는 요약
         old_messages = messages[:-keep_recent]
         summary = self.summarize_conversation(old_messages)
-        
+
         # 요약 + 최근 메시지 반환
         return [
             {"role": "system", "content": f"이전 대화 요약: {summary}"},
             *recent_messages
-        ] 
\ No newline at end of file
+        ]
@@ -0,0 +1,104 @@
+import os
+import time
+import asyncio
+import logging
+from typing import Dict, List, Optional
+from summary_system import ConversationSummarizer
+
+logger = logging.getLogger(__name__)
+
+# 백그라운드 요약 설정
+SUMMARY_DEBOUNCE_SECONDS = float(os.getenv("SUMMARY_DEBOUNCE_SECONDS", "5"))
+SUMMARY_KEEP_RECENT = int(os.getenv("SUMMARY_KEEP_RECENT", "8"))
+SUMMARY_MIN_WINDOW = int(os.getenv("SUMMARY_MIN_WINDOW", "10"))
+
+class SummaryWorker:
+    """세션별 백그라운드 대화 요약 (디바운스, 세션당 최대 1개 작업)"""
+
+    def __init__(self, provider, session_store, debounce_seconds: float = SUMMARY_DEBOUNCE_SECONDS,
+                 keep_recent: int = SUMMARY_KEEP_RECENT, min_window: int = SUMMARY_MIN_WINDOW):
+        self.provider = provider
+        self.session_store = session_store
+        self.debounce_seconds = debounce_seconds
+        self.keep_recent = keep_recent
+        self.min_window = min_window
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._last_scheduled: Dict[str, float] = {}
+        self._api_keys: Dict[str, str] = {}
+
+    def pending_messages(self, session) -> List[Dict]:
+        """아직 요약에 반영되지 않은 오래된 메시지 (최근 메시지는 제외)"""
+        if len(session.full_conversation) <= self.keep_recent:
+            return []
+        return [
+            msg for msg in session.full_conversation[:-self.keep_recent]
+            if msg.get("seq") is not None and msg["seq"] > session.summary_seq and msg["role"] != "system"
+        ]
+
+    def schedule(self, session, api_key: Optional[str]):
+        """턴이 끝난 뒤 요약 예약 (이미 작업 중이면 마지막 예약 시각만 갱신)"""
+        if not api_key:
+            return
+        session_id = session.session_id
+        self._last_scheduled[session_id] = time.monotonic()
+        self._api_keys[session_id] = api_key
+
+        task = self._tasks.get(session_id)
+        if task is None or task.done():
+            self._tasks[session_id] = asyncio.create_task(self._run(session))
+
+    async def _run(self, session):
+        session_id = session.session_id
+        try:
+            while True:
+                # 디바운스: 마지막 예약 이후 조용해질 때까지 대기
+                while True:
+                    remaining = self._last_scheduled[session_id] + self.debounce_seconds - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    await asyncio.sleep(remaining)
+
+                scheduled_at = self._last_scheduled[session_id]
+                await self._summarize(session, self._api_keys[session_id])
+
+                # 요약하는 동안 새 턴이 없었으면 종료
+                if self._last_scheduled[session_id] == scheduled_at:
+                    break
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Background summary failed for session {session_id}: {type(e).__name__}: {e}")
+        finally:
+            self._tasks.pop(session_id, None)
+            self._last_scheduled.pop(session_id, None)
+            self._api_keys.pop(session_id, None)
+
+    async def _summarize(self, session, api_key: str):
+        """요약되지 않은 구간을 이전 요약과 합쳐 새 요약 생성"""
+        window = self.pending_messages(session)
+        if len(window) < self.min_window:
+            return
+
+        generation = session.generation
+        summarizer = ConversationSummarizer(api_key, self.provider)
+        summary = await summarizer.summarize_conversation_async(window, session.summary or None)
+
+        # 요약 도중 대화가 초기화되었으면 버림
+        if session.generation != generation:
+            return
+        session.summary = summary
+        session.summary_seq = window[-1]["seq"]
+        if session.turn_lock.locked():
+            # 진행 중인 턴의 메시지를 중간에 저장하지 않도록, 요약은 그 턴이 저장할 때 함께 기록
+            logger.info(f"Background summary updated for session {session.session_id} (saved with the current turn)")
+            return
+        async with session.turn_lock:
+            await self.session_store.save(session)
+        logger.info(f"Background summary updated for session {session.session_id} (up to seq {session.summary_seq})")
+
+    async def shutdown(self):
+        """진행 중인 요약 작업 취소"""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,406 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import logging
+import threading
+from collections import Counter
+from typing import Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 시청기록 인덱스 설정 (경로를 비우면 메모리에만 만들고 시작할 때마다 다시 파싱)
+VIEWING_HISTORY_INDEX_PATH = os.getenv("VIEWING_HISTORY_INDEX_PATH", "data/viewing_history.index.db")
+# 인덱스 DB를 메모리 매핑할 최대 크기 (바이트)
+VIEWING_HISTORY_MMAP_BYTES = int(os.getenv("VIEWING_HISTORY_MMAP_BYTES", str(64 * 1024 * 1024)))
+# 전체 / 주제별로 인덱스에 남길 최근 영상 수
+VIEWING_HISTORY_MAX_RECENT = int(os.getenv("VIEWING_HISTORY_MAX_RECENT", "200"))
+# /viewing-history와 프롬프트에 넘기는 최근 영상 수 (주제별 목록은 주제당 5개)
+VIEWING_HISTORY_SUMMARY_VIDEOS = int(os.getenv("VIEWING_HISTORY_SUMMARY_VIDEOS", "20"))
+VIEWING_HISTORY_CHUNK_SIZE = int(os.getenv("VIEWING_HISTORY_CHUNK_SIZE", str(64 * 1024)))
+# user_id가 없는 내보내기 (Google Takeout 등)에 쓸 사용자 ID
+VIEWING_HISTORY_DEFAULT_USER = os.getenv("VIEWING_HISTORY_DEFAULT_USER", "default")
+
+INDEX_SCHEMA_VERSION = 1
+
+INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sources (
+    path TEXT PRIMARY KEY,
+    stamp TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    built_at REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS users (
+    user_id TEXT PRIMARY KEY,
+    video_count INTEGER NOT NULL,
+    top_interests TEXT NOT NULL,
+    favorite_category TEXT,
+    total_watch_time TEXT
+);
+
+CREATE TABLE IF NOT EXISTS counts (
+    user_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    name TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (user_id, kind, name)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS videos (
+    user_id TEXT NOT NULL,
+    topic TEXT NOT NULL,
+    rank INTEGER NOT NULL,
+    title TEXT NOT NULL,
+    category TEXT,
+    watched_at TEXT,
+    PRIMARY KEY (user_id, topic, rank)
+) WITHOUT ROWID;
+"""
+
+# ConversationLogic의 대화 주제별 키워드 (제목, 카테고리, 태그에서 검색)
+TOPIC_KEYWORDS = {
+    "food": ["food", "cook", "recipe", "mukbang", "eat", "요리", "음식", "레시피", "먹방", "맛집", "베이킹"],
+    "entertainment": ["movie", "show", "drama", "music", "영화", "드라마", "예능", "리얼리티", "연애", "로맨스", "음악", "뮤직"],
+    "work_study": ["work", "study", "learn", "lecture", "tutorial", "english", "공부", "강의", "교육", "학습", "영어", "회화", "업무"],
+}
+TOPICS = list(TOPIC_KEYWORDS)
+ALL_TOPICS = ""  # videos 테이블에서 주제와 무관한 전체 최근 목록
+
+# Google Takeout 제목 ("Watched ..." / "... 을(를) 시청했습니다.")
+_TAKEOUT_TITLE_PREFIX = "Watched "
+_TAKEOUT_TITLE_SUFFIX = re.compile(r"\s*을\(를\) 시청했습니다\.?$")
+_HOURS = re.compile(r"(\d+)\s*시간")
+_MINUTES = re.compile(r"(\d+)\s*분")
+
+class JSONStream:
+    """파일을 조금씩 읽으면서 JSON 값을 하나씩 꺼내는 파서 (배열은 원소 단위로 순회)"""
+
+    def __init__(self, file, chunk_size: int = VIEWING_HISTORY_CHUNK_SIZE):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self) -> bool:
+        chunk = self.file.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        # 이미 읽은 부분은 버려서 버퍼 크기를 청크 몇 개 수준으로 유지
+        if self.pos >= self.chunk_size:
+            self.buffer = self.buffer[self.pos:]
+            self.pos = 0
+        self.buffer += chunk
+        return True
+
+    def peek(self) -> str:
+        """공백을 건너뛴 다음 문자 (파일 끝이면 빈 문자열)"""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in " \t\r\n":
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char: str):
+        if self.peek() != char:
+            raise ValueError(f"Expected '{char}' at offset {self.pos}")
+        self.pos += 1
+
+    def value(self):
+        """다음 JSON 값 하나 (버퍼에서 잘린 값이면 더 읽어서 다시 디코딩)"""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if self._fill():
+                    continue
+                raise
+            # 숫자가 버퍼 끝에서 잘렸을 수 있음 ("2." + "5e3")
+            if (not self.eof and isinstance(value, (int, float)) and not isinstance(value, bool)
+                    and self.buffer[end:end + 1] in ("", ".", "e", "E", "+", "-") and self._fill()):
+                continue
+            self.pos = end
+            return value
+
+    def items(self) -> Iterator:
+        """배열 원소를 하나씩 반환"""
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            separator = self.peek()
+            self.pos += 1
+            if separator == "]":
+                return
+            if separator != ",":
+                raise ValueError(f"Expected ',' or ']' at offset {self.pos - 1}")
+
+def iter_viewing_history(file, chunk_size: int = VIEWING_HISTORY_CHUNK_SIZE) -> Tuple[Dict, Iterator]:
+    """
+    시청기록 파일을 스트리밍으로 읽기 ((기타 최상위 필드, 시청 항목 이터레이터) 반환)
+
+    앱 형식 ({"user_id": ..., "viewing_history": [...], ...})과 Google Takeout watch-history.json ([...])을 지원합니다.
+    최상위 필드는 이터레이터를 끝까지 돈 뒤에 모두 채워집니다.
+    """
+    stream = JSONStream(file, chunk_size)
+    fields: Dict = {}
+
+    def entries():
+        start = stream.peek()
+        if start == "[":
+            yield from stream.items()
+            return
+        stream.expect("{")
+        if stream.peek() == "}":
+            return
+        while True:
+            key = stream.value()
+            stream.expect(":")
+            if key == "viewing_history" and stream.peek() == "[":
+                yield from stream.items()
+            else:
+                fields[key] = stream.value()
+            separator = stream.peek()
+            stream.pos += 1
+            if separator == "}":
+                return
+            if separator != ",":
+                raise ValueError(f"Expected ',' or '}}' at offset {stream.pos - 1}")
+
+    return fields, entries()
+
+def classify_topic(*texts: str) -> Optional[str]:
+    """영상 정보로 대화 주제 추정 (ConversationLogic 주제와 같은 이름, 없으면 None)"""
+    text = " ".join(texts).lower()
+    for topic, keywords in TOPIC_KEYWORDS.items():
+        if any(keyword in text for keyword in keywords):
+            return topic
+    return None
+
+def watch_minutes(watch_time) -> int:
+    """'1시간 5분' 형식의 시청 시간을 분으로 (알 수 없으면 0)"""
+    if not isinstance(watch_time, str):
+        return 0
+    hours = _HOURS.search(watch_time)
+    minutes = _MINUTES.search(watch_time)
+    return (int(hours.group(1)) * 60 if hours else 0) + (int(minutes.group(1)) if minutes else 0)
+
+def format_minutes(total: int) -> str:
+    hours, minutes = divmod(total, 60)
+    return f"{hours}시간 {minutes}분" if hours else f"{minutes}분"
+
+def normalize_entry(raw) -> Optional[Dict]:
+    """앱 형식 / Google Takeout 항목을 공통 형식으로 (광고나 제목 없는 항목은 None)"""
+    if not isinstance(raw, dict):
+        return None
+
+    if "time" in raw and "date" not in raw:
+        # Google Takeout: 카테고리 대신 채널 이름, 시청 시간과 태그는 없음
+        if any(detail.get("name") == "From Google Ads" for detail in raw.get("details", []) if isinstance(detail, dict)):
+            return None
+        title = raw.get("title") or ""
+        if title.startswith(_TAKEOUT_TITLE_PREFIX):
+            title = title[len(_TAKEOUT_TITLE_PREFIX):]
+        title = _TAKEOUT_TITLE_SUFFIX.sub("", title).strip()
+        subtitles = raw.get("subtitles") or [{}]
+        category = subtitles[0].get("name") if isinstance(subtitles[0], dict) else None
+        entry = {"title": title, "category": category or raw.get("header"), "date": raw.get("time"),
+                 "tags": [], "minutes": 0}
+    else:
+        tags = raw.get("interest_tags")
+        entry = {"title": str(raw.get("title") or "").strip(), "category": raw.get("category"),
+                 "date": raw.get("date"), "tags": [tag for tag in tags if isinstance(tag, str)] if isinstance(tags, list) else [],
+                 "minutes": watch_minutes(raw.get("watch_time"))}
+
+    if not entry["title"]:
+        return None
+    entry["date"] = str(entry["date"] or "")
+    entry["topic"] = classify_topic(entry["title"], entry["category"] or "", *entry["tags"])
+    return entry
+
+class RecentTitles:
+    """최근에 본 제목 max_items개 (같은 제목은 가장 최근 시청 기준 한 번만, 메모리는 max_items의 몇 배로 제한)"""
+
+    def __init__(self, max_items: int):
+        self.max_items = max_items
+        self._latest: Dict[str, Tuple[Tuple[str, int], Dict]] = {}
+
+    def add(self, order: Tuple[str, int], entry: Dict):
+        current = self._latest.get(entry["title"])
+        if current is None or order > current[0]:
+            self._latest[entry["title"]] = (order, entry)
+        if len(self._latest) > self.max_items * 4:
+            # 잘려 나간 제목은 남은 항목들보다 오래되었으므로 나중에 다시 와도 상위에 들 수 없음
+            self._latest = dict(self._ranked()[:self.max_items * 2])
+
+    def _ranked(self):
+        return sorted(self._latest.items(), key=lambda item: item[1][0], reverse=True)
+
+    def ranked(self) -> List[Dict]:
+        return [entry for _, (_, entry) in self._ranked()[:self.max_items]]
+
+class IndexBuilder:
+    """시청 항목을 하나씩 받아 관심사/카테고리/주제 빈도와 최근 영상 목록을 집계"""
+
+    def __init__(self, max_recent: int = VIEWING_HISTORY_MAX_RECENT):
+        self.counts: Dict[str, Counter] = {"interest": Counter(), "category": Counter(), "topic": Counter()}
+        self.recent = {topic: RecentTitles(max_recent) for topic in [ALL_TOPICS, *TOPICS]}
+        self.video_count = 0
+        self.total_minutes = 0
+
+    def add(self, entry: Dict):
+        # 날짜가 같으면 파일에서 나중에 나온 항목을 더 최근으로
+        order = (entry["date"], self.video_count)
+        self.video_count += 1
+        self.total_minutes += entry["minutes"]
+        self.counts["interest"].update(entry["tags"])
+        if entry["category"]:
+            self.counts["category"][entry["category"]] += 1
+        self.recent[ALL_TOPICS].add(order, entry)
+        if entry["topic"]:
+            self.counts["topic"][entry["topic"]] += 1
+            self.recent[entry["topic"]].add(order, entry)
+
+    def profile(self, fields: Dict) -> Dict:
+        """사용자 요약 (파일에 직접 적힌 관심사/카테고리/총 시청시간이 있으면 우선)"""
+        top_interests = fields.get("top_interests")
+        if not isinstance(top_interests, list):
+            # 태그가 없는 내보내기는 많이 본 카테고리 (채널)를 관심사로 사용
+            source = self.counts["interest"] or self.counts["category"]
+            top_interests = [name for name, _ in source.most_common(5)]
+        favorite_category = fields.get("favorite_category")
+        if not favorite_category and self.counts["category"]:
+            favorite_category = self.counts["category"].most_common(1)[0][0]
+        total_watch_time = fields.get("total_watch_time")
+        if not total_watch_time and self.total_minutes:
+            total_watch_time = format_minutes(self.total_minutes)
+        return {"top_interests": top_interests, "favorite_category": favorite_category,
+                "total_watch_time": total_watch_time}
+
+class ViewingHistoryIndex:
+    """
+    사용자별 시청기록 인덱스 (SQLite, 메모리 매핑으로 읽기)
+
+    원본 파일은 바뀌었을 때만 스트리밍으로 한 번 파싱해서 빈도와 최근 영상 목록만 저장하고,
+    이후 시작할 때는 원본을 읽지 않고 인덱스에서 요약만 가져옵니다.
+    """
+
+    def __init__(self, path: str = VIEWING_HISTORY_INDEX_PATH, mmap_bytes: int = VIEWING_HISTORY_MMAP_BYTES,
+                 max_recent: int = VIEWING_HISTORY_MAX_RECENT, summary_videos: int = VIEWING_HISTORY_SUMMARY_VIDEOS):
+        self.path = path or ":memory:"
+        self.max_recent = max_recent
+        self.summary_videos = summary_videos
+        self._lock = threading.Lock()
+
+        if self.path != ":memory:":
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+        self._connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(f"PRAGMA mmap_size={int(mmap_bytes)}")
+        if self._connection.execute("PRAGMA user_version").fetchone()[0] != INDEX_SCHEMA_VERSION:
+            with self._connection:
+                for table in ("sources", "users", "counts", "videos"):
+                    self._connection.execute(f"DROP TABLE IF EXISTS {table}")
+                self._connection.executescript(INDEX_SCHEMA)
+                self._connection.execute(f"PRAGMA user_version={INDEX_SCHEMA_VERSION}")
+
+    @staticmethod
+    def _stamp(source_path: str) -> str:
+        stat = os.stat(source_path)
+        return f"{stat.st_mtime_ns}:{stat.st_size}"
+
+    def load(self, source_path: str) -> Dict:
+        """원본 파일의 사용자 요약 (인덱스가 원본보다 오래되었으면 다시 만듦, 파일이 없거나 깨졌으면 예외)"""
+        key = os.path.abspath(source_path)
+        stamp = self._stamp(source_path)
+        with self._lock:
+            row = self._connection.execute("SELECT stamp, user_id FROM sources WHERE path = ?", (key,)).fetchone()
+            if row is not None and row[0] == stamp:
+                user_id = row[1]
+            else:
+                user_id = self._build(key, stamp)
+            return self._summary(user_id)
+
+    def _build(self, key: str, stamp: str) -> str:
+        started = time.perf_counter()
+        builder = IndexBuilder(self.max_recent)
+        with open(key, "r", encoding="utf-8-sig") as f:
+            fields, entries = iter_viewing_history(f)
+            for raw in entries:
+                entry = normalize_entry(raw)
+                if entry is not None:
+                    builder.add(entry)
+
+        user_id = str(fields.get("user_id") or VIEWING_HISTORY_DEFAULT_USER)
+        profile = builder.profile(fields)
+        with self._connection:
+            for table in ("users", "counts", "videos"):
+                self._connection.execute(f"DELETE FROM {table} WHERE user_id = ?", (user_id,))
+            self._connection.execute(
+                "INSERT INTO users (user_id, video_count, top_interests, favorite_category, total_watch_time) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (user_id, builder.video_count, json.dumps(profile["top_interests"], ensure_ascii=False),
+                 profile["favorite_category"], profile["total_watch_time"])
+            )
+            self._connection.executemany(
+                "INSERT INTO counts (user_id, kind, name, count) VALUES (?, ?, ?, ?)",
+                ((user_id, kind, str(name), count) for kind, counter in builder.counts.items() for name, count in counter.items())
+            )
+            self._connection.executemany(
+                "INSERT INTO videos (user_id, topic, rank, title, category, watched_at) VALUES (?, ?, ?, ?, ?, ?)",
+                ((user_id, topic, rank, entry["title"], entry["category"], entry["date"])
+                 for topic, recent in builder.recent.items() for rank, entry in enumerate(recent.ranked()))
+            )
+            self._connection.execute(
+                "INSERT OR REPLACE INTO sources (path, stamp, user_id, built_at) VALUES (?, ?, ?, ?)",
+                (key, stamp, user_id, time.time())
+            )
+        logger.info(f"Viewing history index built for {user_id}: {builder.video_count} videos "
+                    f"in {time.perf_counter() - started:.2f}s")
+        return user_id
+
+    def recent_videos(self, user_id: str, topic: Optional[str] = None, limit: int = 10) -> List[Dict]:
+        """최근에 본 영상 (topic을 주면 그 대화 주제 영상만)"""
+        rows = self._connection.execute(
+            "SELECT title, category, watched_at FROM videos WHERE user_id = ? AND topic = ? ORDER BY rank LIMIT ?",
+            (user_id, topic or ALL_TOPICS, limit)
+        ).fetchall()
+        return [{"title": title, "category": category, "date": watched_at} for title, category, watched_at in rows]
+
+    def _summary(self, user_id: str) -> Dict:
+        row = self._connection.execute(
+            "SELECT video_count, top_interests, favorite_category, total_watch_time FROM users WHERE user_id = ?",
+            (user_id,)
+        ).fetchone()
+        video_count, top_interests, favorite_category, total_watch_time = row
+        return {
+            "user_id": user_id,
+            "viewing_history": self.recent_videos(user_id, limit=self.summary_videos),
+            "top_interests": json.loads(top_interests),
+            "total_watch_time": total_watch_time,
+            "favorite_category": favorite_category,
+            "video_count": video_count,
+            "topic_videos": {
+                topic: [video["title"] for video in self.recent_videos(user_id, topic, limit=5)] for topic in TOPICS
+            },
+        }
+
+    def close(self):
+        """인덱스 연결 닫기 (진행 중인 재생성이 있으면 끝날 때까지 대기)"""
+        with self._lock:
+            self._connection.close()
+
+# 전역 시청기록 인덱스 인스턴스
+viewing_history_index = ViewingHistoryIndex()
@@ -13,6 +13,16 @@ export default function Home() {
   const [showApiKeyModal, setShowApiKeyModal] = useState(false)
   const [viewingHistory, setViewingHistory] = useState(null)
   const messagesEndRef = useRef(null)
+  // 서버 세션 ID (탭마다 별도 대화 히스토리)
+  const sessionIdRef = useRef(null)
+  if (sessionIdRef.current === null) {
+    sessionIdRef.current = `${Date.now()}-${Math.random().toString(36).slice(2)}`
+  }
+  // 대화용 WebSocket (연결되지 않았으면 HTTP로 전송)
+  const socketRef = useRef(null)
+  // 스트리밍 중인 화자별 메시지 ID
+  const streamingIdsRef = useRef({})
+  const lastTypingSentRef = useRef(0)
 
   // 로컬 스토리지에서 API 키 로드
   useEffect(() => {
@@ -135,6 +145,86 @@ export default function Home() {
     }
   }, [currentView, viewingHistory, openaiApiKey, googleApiKey])
 
+  // 서버가 보내는 턴 이벤트 처리 (start, delta, end, error, done)
+  const handleSocketEvent = (event) => {
+    if (event.type === 'start') {
+      const ids = {}
+      const now = Date.now()
+      const placeholders = event.speakers.map((speaker) => {
+        ids[speaker] = `${now}-${speaker}`
+        return { id: ids[speaker], content: '', sender: 'ai', timestamp: new Date(), interjection: !!event.interjection }
+      })
+      streamingIdsRef.current = ids
+      setMessages(prev => [...prev, ...placeholders])
+    } else if (event.type === 'delta') {
+      const id = streamingIdsRef.current[event.speaker]
+      setMessages(prev => prev.map(message => (
+        message.id === id ? { ...message, content: message.content + event.delta } : message
+      )))
+    } else if (event.type === 'error') {
+      const id = event.speaker && streamingIdsRef.current[event.speaker]
+      if (id) {
+        setMessages(prev => prev.map(message => (message.id === id ? { ...message, content: event.message } : message)))
+      } else {
+        setMessages(prev => [...prev, {
+          id: (Date.now() + 1).toString(),
+          content: event.message,
+          sender: 'ai',
+          timestamp: new Date()
+        }])
+      }
+    } else if (event.type === 'done') {
+      const ids = Object.values(streamingIdsRef.current)
+      streamingIdsRef.current = {}
+      // 사용자가 입력을 시작해서 취소된 Tom 끼어들기와 빈 메시지는 제거
+      setMessages(prev => prev.filter(message => (
+        !ids.includes(message.id) || (message.content && !event.cancelled)
+      )))
+      if (!event.interjection) {
+        setIsLoading(false)
+      }
+    }
+  }
+
+  // 3인/2인 대화 화면에서는 WebSocket 연결 유지 (Tom이 먼저 말을 걸 수 있음)
+  useEffect(() => {
+    if (currentView !== 'chat' || (currentMenu !== 'interest-3' && currentMenu !== 'interest-2')) {
+      return
+    }
+    const mode = currentMenu === 'interest-2' ? '2person' : '3person'
+    const socket = new WebSocket(`ws://localhost:8001/ws?session_id=${encodeURIComponent(sessionIdRef.current)}&mode=${mode}`)
+    socket.onmessage = (message) => handleSocketEvent(JSON.parse(message.data))
+    socket.onerror = (error) => console.error('WebSocket error:', error)
+    socket.onclose = () => {
+      if (socketRef.current === socket) {
+        socketRef.current = null
+      }
+    }
+    socketRef.current = socket
+    return () => {
+      socketRef.current = null
+      socket.close()
+    }
+  }, [currentView, currentMenu])
+
+  // 입력 중임을 서버에 알림 (Tom 끼어들기 타이머 초기화, 최대 1초에 한 번)
+  const handleInputChange = (e) => {
+    setInputMessage(e.target.value)
+    const socket = socketRef.current
+    const now = Date.now()
+    if (socket && socket.readyState === WebSocket.OPEN && now - lastTypingSentRef.current > 1000) {
+      lastTypingSentRef.current = now
+      socket.send(JSON.stringify({ type: 'typing' }))
+    }
+  }
+
+  // Tom에게 현재 주제의 표현 힌트 요청 (3인 대화, WebSocket 연결 시)
+  const requestHelp = () => {
+    const socket = socketRef.current
+    if (isLoading || !socket || socket.readyState !== WebSocket.OPEN) return
+    socket.send(JSON.stringify({ type: 'help' }))
+  }
+
   const sendMessage = async () => {
     if (!inputMessage.trim() || isLoading) return
 
@@ -149,6 +239,17 @@ export default function Home() {
     setInputMessage('')
     setIsLoading(true)
 
+    // WebSocket이 연결되어 있으면 그대로 전송 (응답은 handleSocketEvent에서 스트리밍으로 표시)
+    const socket = socketRef.current
+    if (socket && socket.readyState === WebSocket.OPEN) {
+      socket.send(JSON.stringify({
+        type: 'message',
+        message: inputMessage,
+        api_key: currentMenu === 'interest-2' ? googleApiKey : openaiApiKey
+      }))
+      return
+    }
+
     try {
       // 현재 메뉴에 따라 다른 엔드포인트 사용
       const endpoint = currentMenu === 'interest-2' ? '/chat-2person' : '/chat'
@@ -160,10 +261,23 @@ export default function Home() {
         },
         body: JSON.stringify({ 
           message: inputMessage,
-          api_key: currentMenu === 'interest-2' ? googleApiKey : openaiApiKey
+          api_key: currentMenu === 'interest-2' ? googleApiKey : openaiApiKey,
+          session_id: sessionIdRef.current
         }),
       })
 
+      // 서버가 바쁘면 (429) 서버 안내 메시지를 그대로 표시
+      if (response.status === 429) {
+        const data = await response.json()
+        setMessages(prev => [...prev, {
+          id: (Date.now() + 1).toString(),
+          content: data.response,
+          sender: 'ai',
+          timestamp: new Date()
+        }])
+        return
+      }
+
       if (!response.ok) {
         throw new Error(`HTTP error! status: ${response.status}`)
       }
@@ -477,12 +591,22 @@ export default function Home() {
                   <input
                     type="text"
                     value={inputMessage}
-                    onChange={(e) => setInputMessage(e.target.value)}
+                    onChange={handleInputChange}
                     onKeyPress={handleKeyPress}
                     placeholder="메시지를 입력하세요..."
                     className="flex-1 border border-gray-300 rounded-xl px-4 py-2 focus:outline-none focus:ring-2 focus:ring-blue-500 focus:border-transparent text-gray-900 placeholder-gray-500"
                     disabled={isLoading}
                   />
+                  {currentMenu === 'interest-3' && (
+                    <button
+                      onClick={requestHelp}
+                      disabled={isLoading}
+                      title="Tom에게 표현 힌트 요청"
+                      className="border border-gray-300 text-gray-700 px-3 py-2 rounded-xl hover:bg-gray-100 focus:outline-none focus:ring-2 focus:ring-blue-500 disabled:opacity-50 disabled:cursor-not-allowed transition-colors"
+                    >
+                      💡
+                    </button>
+                  )}
                   <button
                     onClick={sendMessage}
                     disabled={!inputMessage.trim() || isLoading}